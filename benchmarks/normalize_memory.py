@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Compares peak memory of sanitizing and normalizing table data.
+
+old -- uniquebool.deep_replace_bool followed by a copy.deepcopy of the result
+       (what tags2table used to do before normalize_table built new rows)
+new -- tags2table.Columns and normalize_table (copies only changed cells)
+
+usage: python benchmarks/normalize_memory.py [n_rows]
+"""
+import os
+import sys
+import copy
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import labels2tables.tags2table as t2t
+import labels2tables.uniquebool as uniquebool
+
+def make_data(n_rows, seed=0):
+    rnd = random.Random(seed)
+    cols = ['game', 'model', 'open-access', 'reference', 'year']
+    data = []
+    for r in range(n_rows):
+        row = {
+            'game': [rnd.choice(['soccer', 'basketball', 'golf'])],
+            'model': rnd.choice([['network', 'centrality'], ['network'], ['sequence']]),
+            'reference': 'ref_%d' % r,
+            'year': 2000 + r % 20,
+        }
+        if rnd.random() < 0.5:
+            row['open-access'] = True
+        data.append(row)
+    return cols, data
+
+def measure(func):
+    # time without tracing, as tracemalloc slows down allocation
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    del result
+
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, elapsed
+
+def main(n_rows):
+    cols, data = make_data(n_rows)
+    table = t2t.t.Table()
+    header_tree, col_chains, table_cols, num_header_rows = t2t.set_headers(cols, data, table)
+
+    def old():
+        sanitized = uniquebool.deep_replace_bool(data)
+        return copy.deepcopy(sanitized)
+
+    def new():
+        return t2t.normalize_table(t2t.Columns(col_chains, data), [None] * table_cols)
+
+    for name, func in [('old', old), ('new', new)]:
+        peak, elapsed = measure(func)
+        print('{0}: peak {1:.1f} MiB, {2:.2f} s'.format(name, peak / 1024.0 / 1024.0, elapsed))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Times bib2labels, each stage of tags2table and TxtTable.present
+on synthetic data (see synthetic.py).
+
+usage: python benchmarks/run.py [--case NAME ...] [--rows N] [--cols N] ...
+                                [--output results.json]
+                                [--compare baseline.json] [--threshold 0.25]
+
+Each stage is timed over --repeat runs and the fastest is kept.
+Results are written as JSON. With --compare, stages that got slower than the
+baseline by more than --threshold (a fraction) are reported as regressions,
+and the exit code is 1.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import labels2tables.core as core
+import labels2tables.tags2table as t2t
+import labels2tables.table as t
+import labels2tables.trace as trace
+import synthetic
+
+# name -> params (overrides of synthetic.DEFAULTS)
+CASES = {
+    'default': {},
+    'large': {'rows': 20000},
+    'wide': {'cols': 30},
+    'deep': {'depth': 5},
+    'high_cardinality': {'cardinality': 200},
+    'sparse': {'sparsity': 0.8},
+    'bool_heavy': {'bool_ratio': 0.9},
+}
+
+STAGES = ['bib2labels', 'set_headers', 'columns', 'normalize_table', 'sort_table', 'group_rows',
+          'create_data_tree', 'build_table', 'fill_headers', 'fill_data_cels', 'present']
+
+# differences smaller than this (seconds) are noise, never regressions
+MIN_DELTA = 0.002
+
+clock = timeit.default_timer
+
+class StageTimes(trace.Tracer):
+    def __init__(self):
+        self.times = {}
+    def stage_end(self, stage, elapsed, counts, peak):
+        self.times[stage] = elapsed
+
+def time_tables(labels):
+    """
+    labels  -- labels dict
+    returns -- stage -> seconds, for each tags2table stage and present
+    """
+    tracer = StageTimes()
+    table = t2t.tags2table(dict(labels), tracer=tracer)
+    span = trace.start(tracer, 'present')
+    t.TxtTable().present(table)
+    trace.end(span)
+    return tracer.times
+
+def time_bib(bib_file):
+    start = clock()
+    core.bib2labels(bib_file)
+    return clock() - start
+
+def run_case(params, repeat, bib=True):
+    """
+    params  -- generator params
+    repeat  -- number of runs (fastest is kept)
+    bib     -- also time bib2labels on a generated bibtex file
+    returns -- stage -> seconds
+    """
+    best = {}
+    def keep(stage, seconds):
+        best[stage] = min(seconds, best.get(stage, seconds))
+
+    labels = synthetic.make_labels(**params)
+    for i in range(repeat):
+        for stage, seconds in time_tables(labels).items():
+            keep(stage, seconds)
+
+    if bib:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            bib_file = os.path.join(tmp_dir, 'synthetic.bib')
+            synthetic.make_bib(bib_file, **params)
+            for i in range(repeat):
+                keep('bib2labels', time_bib(bib_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+    return best
+
+def compare(results, baseline, threshold):
+    """
+    results, baseline -- JSON results
+    threshold -- allowed slowdown, as a fraction of the baseline time
+    returns   -- list of (case, stage, baseline seconds, seconds) that regressed
+    """
+    regressions = []
+    for name, case in sorted(results['cases'].items()):
+        if name not in baseline['cases']:
+            continue
+        old_case = baseline['cases'][name]
+        if old_case['params'] != case['params']:
+            sys.stderr.write('{0}: params differ from baseline, skipped\n'.format(name))
+            continue
+        for stage in STAGES:
+            if stage not in case['stages'] or stage not in old_case['stages']:
+                continue
+            old = old_case['stages'][stage]
+            new = case['stages'][stage]
+            if new > old * (1 + threshold) and new - old > MIN_DELTA:
+                regressions.append((name, stage, old, new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark labels2tables on synthetic data')
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help='predefined case to run (repeatable, default: all)')
+    for param, default in sorted(synthetic.DEFAULTS.items()):
+        parser.add_argument('--' + param.replace('_', '-'), dest=param, type=type(default),
+                            help='generator param (default: {0}), runs a single custom case'.format(default))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-bib', dest='bib', action='store_false',
+                        help="don't time bib2labels")
+    parser.add_argument('--output', help='file to write JSON results to (default: stdout)')
+    parser.add_argument('--compare', help='baseline JSON results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown as a fraction (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    custom = dict((param, getattr(args, param)) for param in synthetic.DEFAULTS
+                  if getattr(args, param) is not None)
+    if custom:
+        cases = {'custom': custom}
+    else:
+        cases = dict((name, CASES[name]) for name in (args.case or CASES))
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'cases': {},
+    }
+    for name, overrides in sorted(cases.items()):
+        params = dict(synthetic.DEFAULTS)
+        params.update(overrides)
+        sys.stderr.write('{0}...\n'.format(name))
+        results['cases'][name] = {
+            'params': params,
+            'stages': run_case(params, args.repeat, args.bib),
+        }
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, stage, old, new in regressions:
+            sys.stderr.write('REGRESSION {0} {1}: {2:.4f} s -> {3:.4f} s ({4:+.0%})\n'.format(
+                name, stage, old, new, new / old - 1))
+        if regressions:
+            return 1
+        sys.stderr.write('no regressions\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
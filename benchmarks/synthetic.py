@@ -0,0 +1,84 @@
+"""
+Generates synthetic labels dicts and bibtex files for benchmarking.
+
+rows        -- number of rows (bibtex entries)
+cols        -- number of keyword cols (in addition to the reference col)
+depth       -- max number of levels below each keyword (1 => game:soccer)
+cardinality -- number of distinct values at each level of a keyword
+sparsity    -- fraction of cells left out of each row (each row keeps at least one)
+bool_ratio  -- fraction of cols that are plain (bool) keywords
+seed        -- random seed (same params and seed => same output)
+"""
+import random
+
+DEFAULTS = {
+    'rows': 1000,
+    'cols': 6,
+    'depth': 2,
+    'cardinality': 5,
+    'sparsity': 0.2,
+    'bool_ratio': 0.3,
+    'seed': 0,
+}
+
+def make_keywords(rows=1000, cols=6, depth=2, cardinality=5, sparsity=0.2, bool_ratio=0.3, seed=0):
+    """
+    returns -- list of (reference, [keyword, ...]) per row, in bibtex keyword syntax
+    """
+    rnd = random.Random(seed)
+    n_bool = int(round(cols * bool_ratio))
+    names = ['label%d' % c for c in range(cols)]
+    entries = []
+    for r in range(rows):
+        keywords = []
+        # every entry needs a keyword (bib2labels expects a keywords field)
+        kept = rnd.randrange(cols)
+        for c, name in enumerate(names):
+            if c != kept and rnd.random() < sparsity:
+                continue
+            if c < n_bool:
+                keywords.append(name)
+            else:
+                levels = rnd.randint(1, max(1, depth))
+                path = ['v%d' % rnd.randrange(cardinality) for level in range(levels)]
+                keywords.append(':'.join([name] + path))
+        entries.append(('ref%06d' % r, keywords))
+    return entries
+
+def make_labels(**params):
+    """
+    params  -- see module docstring
+    returns -- labels dict, as bib2labels would return for make_bib(**params)
+    """
+    rows = []
+    cols_set = set(['reference'])
+    for reference, keywords in make_keywords(**params):
+        row = {'reference': reference}
+        for keyword in keywords:
+            sub_keywords = keyword.split(':')
+            if len(sub_keywords) > 1:
+                row[sub_keywords[0]] = sub_keywords[1:]
+            else:
+                row[keyword] = True
+        cols_set.update(row)
+        rows.append(row)
+    return {
+        'cols': sorted(cols_set),
+        'sort_rows': True,
+        'sort_last': ['reference'],
+        'data': rows,
+    }
+
+def make_bib(path, **params):
+    """
+    Writes a bibtex file
+    path    -- file to write
+    params  -- see module docstring
+    """
+    with open(path, 'w') as f:
+        for reference, keywords in make_keywords(**params):
+            f.write('@article{%s,\n' % reference)
+            f.write('\ttitle = {Synthetic {Entry} %s},\n' % reference)
+            f.write('\tyear = {%d},\n' % (2000 + int(reference[3:]) % 20))
+            f.write('\tkeywords = {%s}\n' % ', '.join(keywords))
+            f.write('}\n\n')
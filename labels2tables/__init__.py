@@ -1,2 +1,11 @@
-from .core import bib2labels, labels2txt
-__all__ = ["bib2labels", "labels2txt"]
+import sys
+from .core import bib2labels, bib2labels_multi, labels2txt, preview
+from .bibcache import BibCache
+from .trace import Tracer, StageReport
+from .keywordindex import KeywordIndex, bib2index
+__all__ = ["bib2labels", "bib2labels_multi", "labels2txt", "preview", "BibCache", "Tracer", "StageReport", "KeywordIndex", "bib2index"]
+
+if sys.version_info >= (3, 5):
+    # uses async syntax
+    from .aio import bib2labels_async, labels2txt_async, gather_bounded
+    __all__ += ["bib2labels_async", "labels2txt_async", "gather_bounded"]
@@ -0,0 +1,77 @@
+"""
+asyncio versions of bib2labels and labels2txt (Python 3.5+).
+
+Files are read and written in the event loop's default executor (a thread
+pool), so many files can be in flight at once. Parsing and table building
+are CPU bound, and run in the executor passed as cpu_executor: None for
+the default thread pool, or a concurrent.futures.ProcessPoolExecutor to
+use more than one core.
+"""
+import asyncio
+import functools
+from . import core
+
+# the loop running the current coroutine (get_running_loop is new in Python 3.7)
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+async def bib2labels_async(
+    bib_file,
+    keyword_filter = "",
+    keyword_separator = ":",
+    label_rename = {
+        "ID": "reference"
+    },
+    fields = ["ID"],
+    cpu_executor = None):
+    """
+    Same as core.bib2labels
+    bib_file     -- path to bibtex file
+    cpu_executor -- concurrent.futures executor to parse in (default: the loop's default executor)
+    returns      -- labels dict (see core.bib2labels for other args)
+    """
+    loop = _running_loop()
+    bibtex_str = await loop.run_in_executor(None, _read, bib_file)
+    parse = functools.partial(
+        core.bibtex2labels, bibtex_str, keyword_filter, keyword_separator, label_rename, fields)
+    return await loop.run_in_executor(cpu_executor, parse)
+
+async def labels2txt_async(labels, output_file, cpu_executor=None):
+    """
+    Same as core.labels2txt
+    labels       -- labels dict
+    output_file  -- filename of output table
+    cpu_executor -- concurrent.futures executor to build the table in (default: the loop's default executor)
+    """
+    loop = _running_loop()
+    text = await loop.run_in_executor(cpu_executor, core.labels2text, labels)
+    await loop.run_in_executor(None, _write, output_file, text)
+
+async def bib2txt_async(bib_file, output_file, cpu_executor=None, **kwargs):
+    """
+    bib2labels_async then labels2txt_async
+    kwargs -- passed to bib2labels_async
+    """
+    labels = await bib2labels_async(bib_file, cpu_executor=cpu_executor, **kwargs)
+    await labels2txt_async(labels, output_file, cpu_executor)
+
+async def gather_bounded(aws, limit=4):
+    """
+    Like asyncio.gather, but runs at most limit of aws at once.
+    e.g. await gather_bounded([bib2txt_async(bib, out) for bib, out in jobs], limit=8)
+    aws     -- coroutines (not yet started)
+    limit   -- max number running at once
+    returns -- list of results, in the same order as aws
+    """
+    semaphore = asyncio.Semaphore(limit)
+    async def run(aw):
+        async with semaphore:
+            return await aw
+    return await asyncio.gather(*[run(aw) for aw in aws])
@@ -0,0 +1,353 @@
+import os
+import time
+import json
+import errno
+import hashlib
+import tempfile
+from . import core
+
+# atomic replace, even if the destination exists (os.rename on Python 2,
+# where it only replaces atomically on POSIX)
+_replace = getattr(os, 'replace', os.rename)
+
+# Default upper bound on the total size of the cache directory (bytes)
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# Temporary files older than this (seconds) were left by a writer that
+# died before replacing the cache file, and are removed like cache files
+TMP_GRACE = 10 * 60
+
+def default_cache_dir():
+    """
+    returns -- per-user cache directory (honours XDG_CACHE_HOME)
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'labels2tables')
+
+def file_hash(path, block_size=1024*1024):
+    """
+    path    -- file to hash
+    returns -- hex sha1 digest of file contents (read in blocks)
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def extract_entry(entry, fields):
+    """
+    Reduce a parsed bibtex entry to just the parts used to build label rows.
+    entry   -- bibtexparser entry dict
+    fields  -- extra fields to keep in addition to keywords
+    returns -- dict
+    """
+    keep = ['keyword'] + list(fields)
+    return dict((k, entry[k]) for k in keep if k in entry)
+
+def record_hash(prefix, record):
+    """
+    prefix  -- hash of the preceding @string definitions
+    record  -- raw bibtex record
+    returns -- hex sha1 digest
+    """
+    h = hashlib.sha1(prefix.encode('utf-8'))
+    h.update(record.encode('utf-8'))
+    return h.hexdigest()
+
+def parse_changed(jobs, fields, workers):
+    """
+    Parses new or changed records in a pool of processes
+    jobs    -- list of (strings, records) to parse together, where strings
+               are the @string macros defined before the records
+    fields  -- see core.create_parser
+    workers -- number of worker processes
+    returns -- list of lists of entries (reduced by extract_entry), one per record
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    result = []
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(core.parse_records, records, strings, fields)
+                   for strings, records in jobs]
+        for future in futures:
+            for entries in future.result():
+                result.append([extract_entry(e, fields) for e in entries])
+    return result
+
+def join_blocks(order, blocks):
+    """
+    order   -- list of record hashes, in file order
+    blocks  -- record hash -> list of entries parsed from that record
+    returns -- list of entries, in file order
+    """
+    entries = []
+    for key in order:
+        entries.extend(blocks[key])
+    return entries
+
+class BibCache(object):
+    """
+    Opt-in on-disk cache of entries extracted from bibtex files.
+    Only the keyword list and the requested fields of each entry are stored.
+    A cached copy is only used if the path, size, mtime and content hash of
+    the bibtex file all match, so a warm run skips bibtexparser entirely.
+    
+    In incremental mode, entries are also cached per record (keyed by a hash
+    of the record text), so that after an edit only the new or changed
+    records are re-parsed.
+    """
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE, incremental=False):
+        """
+        cache_dir   -- directory to store cached entries (default: default_cache_dir())
+        max_size    -- total size in bytes; least recently used files are evicted beyond this
+        incremental -- re-parse only the records that changed since the last run
+        """
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.incremental = incremental
+
+    def _path(self, bib_file, fields):
+        # One cache file per bib file and set of fields.
+        # A changed bib file replaces the stale cache file rather than adding to the cache.
+        key = json.dumps([os.path.abspath(bib_file), list(fields), self.incremental])
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+        return os.path.join(self.cache_dir, name)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            # missing or corrupt
+            return None
+
+    def _write(self, path, obj):
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            # (another process may have just created it)
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file of our own first, so readers never see
+        # a partial file, and concurrent writers don't write to the same file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(obj, f)
+            _replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.evict(keep=path)
+
+    def fingerprint(self, bib_file, content_hash=True):
+        """
+        bib_file     -- path to bibtex file
+        content_hash -- include hash of the file contents
+        returns      -- [path, size, mtime, hash]
+        """
+        st = os.stat(bib_file)
+        digest = file_hash(bib_file) if content_hash else None
+        return [os.path.abspath(bib_file), st.st_size, st.st_mtime, digest]
+
+    def _load(self, bib_file, fields):
+        # returns -- cached file contents, or None if not cached or stale
+        path = self._path(bib_file, fields)
+        cached = self._read(path)
+        if cached is None:
+            return None
+        fingerprint = self.fingerprint(bib_file, content_hash=False)
+        if cached['fingerprint'][:3] != fingerprint[:3]:
+            # cheap check failed, don't bother hashing
+            return None
+        if cached['fingerprint'][3] != file_hash(bib_file):
+            return None
+        # mark as recently used
+        _touch(path)
+        return cached
+
+    def load(self, bib_file, fields):
+        """
+        returns -- cached list of entries, or None if not cached or stale
+        """
+        cached = self._load(bib_file, fields)
+        if cached is None:
+            return None
+        if self.incremental:
+            return join_blocks(cached['order'], cached['blocks'])
+        return cached['entries']
+
+    def store(self, bib_file, fields, entries, fingerprint=None):
+        """
+        entries     -- list of entries as returned by extract_entry
+        fingerprint -- fingerprint of bib_file taken before it was parsed
+        """
+        assert not self.incremental, "incremental cache is stored per record"
+        if fingerprint is None:
+            fingerprint = self.fingerprint(bib_file)
+        self._write(self._path(bib_file, fields), {
+            'fingerprint': fingerprint,
+            'fields': list(fields),
+            'entries': entries,
+        })
+
+    def entries(self, bib_file, fields, workers=1):
+        """
+        Cached equivalent of core.iter_bib_entries (reduced to keywords and fields).
+        workers -- number of processes to parse with on a cache miss
+                   (in incremental mode, to parse the new or changed records)
+        returns -- list of entries
+        """
+        if self.incremental:
+            return self._incremental_entries(bib_file, fields, workers)
+        entries = self.load(bib_file, fields)
+        if entries is None:
+            # fingerprint before parsing, so that an edit made during
+            # parsing invalidates the cache on the next run
+            fingerprint = self.fingerprint(bib_file)
+            entries = [extract_entry(e, fields) for e in core.iter_bib_entries(bib_file, workers, fields)]
+            self.store(bib_file, fields, entries, fingerprint)
+        return entries
+
+    def _incremental_entries(self, bib_file, fields, workers=1, chunk_size=1024*1024):
+        path = self._path(bib_file, fields)
+        cached = self._read(path)
+        fingerprint = self.fingerprint(bib_file)
+        if cached is not None and cached['fingerprint'] == fingerprint:
+            # whole file unchanged
+            _touch(path)
+            return join_blocks(cached['order'], cached['blocks'])
+        
+        old_blocks = cached['blocks'] if cached is not None else {}
+        blocks = {}
+        order = []
+        # with workers, new or changed records are parsed in a pool at the end,
+        # in jobs of about chunk_size characters that share the same macros
+        jobs = []
+        job_keys = []
+        job_strings_hash = None
+        job_len = 0
+        
+        parser = core.create_parser(fields)
+        # Records are parsed independently, except that @string macros
+        # defined earlier in the file are substituted into later records.
+        # Chain the macro definitions into the hash of each record,
+        # so that editing a macro invalidates every record after it.
+        strings_hash = ''
+        for record in core.iter_bib_records(bib_file):
+            if record.lower().startswith('@string'):
+                core.parse_record(parser, record)
+                strings_hash = record_hash(strings_hash, record)
+                continue
+            
+            key = record_hash(strings_hash, record)
+            if key in blocks:
+                pass
+            elif key in old_blocks:
+                # unchanged record, reuse
+                blocks[key] = old_blocks[key]
+            elif workers > 1:
+                if not jobs or job_strings_hash != strings_hash or job_len >= chunk_size:
+                    jobs.append((dict(parser.bib_database.strings), []))
+                    job_strings_hash = strings_hash
+                    job_len = 0
+                jobs[-1][1].append(record)
+                job_len += len(record)
+                job_keys.append(key)
+                blocks[key] = None # parsed below
+            else:
+                # new or changed record
+                blocks[key] = [extract_entry(e, fields) for e in core.parse_record(parser, record)]
+            order.append(key)
+        
+        if jobs:
+            for key, entries in zip(job_keys, parse_changed(jobs, fields, workers)):
+                blocks[key] = entries
+        
+        # only keep blocks still in the file, so edits don't accumulate stale blocks
+        self._write(path, {
+            'fingerprint': fingerprint,
+            'fields': list(fields),
+            'order': order,
+            'blocks': blocks,
+        })
+        return join_blocks(order, blocks)
+
+    def size(self):
+        """
+        returns -- total size of cache files in bytes
+        """
+        return sum([st.st_size for path, st in self._stat_files()])
+
+    def _files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith('.json') or name.endswith('.tmp')]
+
+    def _stat_files(self):
+        # (path, os.stat result) of each cache file and left over temporary file,
+        # skipping files removed by another process in the meantime
+        # and temporary files that may still be being written
+        result = []
+        now = time.time()
+        for path in self._files():
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            if path.endswith('.tmp') and now - st.st_mtime < TMP_GRACE:
+                continue
+            result.append((path, st))
+        return result
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used cache files until the cache fits in max_size
+        keep -- path of a cache file that should not be evicted
+        """
+        files = []
+        total = 0
+        for path, st in self._stat_files():
+            files.append((not path.endswith('.tmp'), st.st_mtime, path, st.st_size))
+            total += st.st_size
+        # left over temporary files, then oldest first
+        for is_cache, mtime, path, size in sorted(files):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove all cached entries (and left over temporary files)
+        """
+        for path, st in self._stat_files():
+            _remove(path)
+
+def _remove(path):
+    # remove a cache file, unless another process already has
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+def _touch(path):
+    # mark a cache file as recently used, unless another process has evicted it
+    try:
+        os.utime(path, None)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
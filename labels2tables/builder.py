@@ -0,0 +1,386 @@
+import bisect
+import collections
+from . import tags2table as t2t
+from . import table as t
+from . import uniquebool
+
+class _Forest(object):
+    # stands in for a root node, to walk just some of its subtrees
+    def __init__(self, children):
+        self.children = children
+
+def _iter_nodes(nodes):
+    # every node in the subtrees of nodes
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children)
+
+def _partition(children, starts, r):
+    # value partition (of children) containing row r
+    # starts -- row_start of each child
+    return children[bisect.bisect_right(starts, r) - 1]
+
+def _is_other(cdata):
+    # cell that makes an inferred col a 'str' col rather than a 'bool' col
+    return cdata is not t2t.MISSING and cdata is not None and type(cdata) is not uniquebool.UniqueBool
+
+class TableBuilder(object):
+    """
+    Stateful version of tags2table, for data that changes a row at a time.
+    Keeps the header tree, col types, hierarchy padding and row tree between
+    changes, so that add_row and remove_row only re-partition the top level
+    partitions next to the changed row, and only re-fill (and re-display)
+    their table rows.
+    A change that alters an inferred col type, or the padding of a hierarchy
+    header already in the table, falls back to a full rebuild.
+    So does every change to a table with group_rows (and not sort_rows).
+    The table always matches tags2table of the current rows.
+    """
+    def __init__(self, table_arg, table_class=t.Table):
+        """
+        table_arg -- as for tags2table (not modified)
+        table_class -- Table class to build (e.g. table.SparseTable)
+        """
+        self.cols = table_arg['cols']
+        self.data = list(table_arg['data'])
+        self.sort_rows = table_arg.get('sort_rows', False)
+        self.sort_last = table_arg.get('sort_last', ())
+        # (rows are grouped by where their values were first seen, so one
+        # change can move rows anywhere in the table)
+        self.group_rows = table_arg.get('group_rows', False) and not self.sort_rows
+        self.given_types = list(table_arg['types']) if 'types' in table_arg else None
+        self.table_class = table_class
+        self.presenter = t.TxtTable()
+        self._rebuild()
+
+    def _rebuild(self):
+        table = self.table_class()
+        header_tree, col_chains, table_cols, num_header_rows = t2t.set_headers(self.cols, self.data, table)
+        if self.given_types is None:
+            self.given_types = [None] * table_cols
+        assert len(self.given_types) == table_cols
+
+        columns = t2t.Columns(col_chains, self.data)
+        # counts used to tell whether a change affects rows already in the table
+        self.other_counts = []
+        self.headers = []
+        for c, values in enumerate(columns.values):
+            if self.given_types[c] is None:
+                self.other_counts.append(sum([1 for cdata in values if _is_other(cdata)]))
+            else:
+                self.other_counts.append(None)
+            self.headers.append(collections.Counter(
+                [tuple(cdata) for cdata in values if type(cdata) is list and cdata]))
+        self.header_lengths = [t2t.hierarchy_lengths(headers) for headers in self.headers]
+
+        self.types = list(self.given_types)
+        t2t.normalize_table(columns, self.types)
+
+        # rows are told apart by a sequence number, in data order
+        self.seqs = list(range(len(self.data)))
+        self.next_seq = len(self.data)
+        self.sort_order = t2t.sort_cols(col_chains, self.sort_last)
+        if self.sort_rows:
+            keys = t2t.row_sort_keys(columns, self.sort_last)
+            order = sorted(range(columns.n_rows), key=keys.__getitem__)
+            columns.reorder(order)
+            # (row key, seq) of each row, in table order
+            self.display_keys = [(keys[r], r) for r in order]
+        elif self.group_rows:
+            t2t.group_rows(columns, self.sort_last)
+
+        row_tree, num_rows = t2t.setup_data_cels(columns)
+        table.set_cols(len(col_chains))
+        table.set_header_rows(num_header_rows)
+        table.set_data_rows(num_rows)
+        table.build()
+        t2t.fill_headers(header_tree, table)
+        t2t.fill_data_cels(table, row_tree)
+        table.partition_rows = t2t.top_partition_rows(row_tree)
+
+        self.header_tree = header_tree
+        self.columns = columns
+        self.row_tree = row_tree
+        self.table = table
+        self.cache = self.presenter.display_cache(table)
+        # number of data cells of each width, per col (for the col widths)
+        self.width_counts = [collections.Counter() for c in range(table.n_cols)]
+        self._count_widths(self.cache.rows, 1)
+        # rendered data rows (None until rendered), and the col widths they were rendered with
+        self.lines = [None] * len(self.cache.rows)
+        self.line_widths = None
+
+    def add_row(self, row):
+        """
+        row -- row dict, as in table_arg['data']
+        """
+        self.data.append(row)
+        seq = self.next_seq
+        self.next_seq += 1
+        self.seqs.append(seq)
+
+        raw = self._raw_cells(row)
+        if self._count(raw, 1) or self.group_rows:
+            self._rebuild()
+            return
+        cells = self._normalize_cells(raw)
+        if self.sort_rows:
+            key = (self._row_key(cells), seq)
+            p = bisect.bisect_right(self.display_keys, key)
+            self.display_keys.insert(p, key)
+        else:
+            p = self.columns.n_rows
+        self._replace_rows(p, 0, [cells])
+
+    def remove_row(self, i):
+        """
+        i -- index of row in data
+        return -- removed row dict
+        """
+        row = self.data.pop(i)
+        seq = self.seqs.pop(i)
+
+        raw = self._raw_cells(row)
+        # normalized as it is in the table (before its header is forgotten)
+        cells = self._normalize_cells(raw)
+        if self._count(raw, -1) or self.group_rows:
+            self._rebuild()
+            return row
+        if self.sort_rows:
+            key = (self._row_key(cells), seq)
+            p = bisect.bisect_left(self.display_keys, key)
+            del self.display_keys[p]
+        else:
+            p = i
+        self._replace_rows(p, 1, [])
+        return row
+
+    def present(self):
+        """
+        Only renders the rows changed since the last call,
+        unless a col width has changed.
+        returns -- table formated as text (see table.TxtTable)
+        """
+        presenter = self.presenter
+        data_widths = [max(counts) if counts else 0 for counts in self.width_counts]
+        dims = presenter.measure(self.table, self.cache, data_widths)
+        col_widths = dims.col_width
+        if col_widths != self.line_widths:
+            # every row is padded differently
+            self.lines = [None] * len(self.lines)
+            self.line_widths = list(col_widths)
+
+        lines = self.lines
+        get_row = self.cache.get_row
+        for r, line in enumerate(lines):
+            if line is None:
+                lines[r] = presenter.format_row(get_row(r), col_widths)
+        head = list(presenter.iter_head_lines(dims))
+        return "\n".join(head + lines + [presenter.rule(dims)])
+
+    def _count_widths(self, rows, step):
+        """
+        Updates width_counts for display rows being added (step 1) or removed (step -1)
+        rows -- flat [c, txt, c, txt, ...] lists, as in DisplayCache.rows
+        """
+        width_counts = self.width_counts
+        for cells in rows:
+            for i in range(0, len(cells), 2):
+                counts = width_counts[cells[i]]
+                width = len(cells[i+1])
+                counts[width] += step
+                if not counts[width]:
+                    del counts[width]
+
+    def _raw_cells(self, row):
+        replace_bool = uniquebool.replace_bool
+        return [replace_bool(row.get(key, t2t.MISSING)) for key in self.columns.keys]
+
+    def _count(self, raw, step):
+        """
+        Updates counts for a row being added (step 1) or removed (step -1)
+        return -- True if the rows already in the table need normalizing again
+        """
+        changed = False
+        for c, cdata in enumerate(raw):
+            if self.other_counts[c] is not None and _is_other(cdata):
+                self.other_counts[c] += step
+                if self.other_counts[c] == (1 if step > 0 else 0):
+                    # inferred type changes
+                    changed = True
+
+            if type(cdata) is list and cdata:
+                key = tuple(cdata)
+                headers = self.headers[c]
+                headers[key] += step
+                if headers[key] == 0:
+                    del headers[key]
+                elif headers[key] != 1 or step < 0:
+                    # same set of headers
+                    continue
+                lengths = t2t.hierarchy_lengths(headers)
+                old_lengths = self.header_lengths[c]
+                for header in headers:
+                    if header != key and lengths[header] != old_lengths[header]:
+                        # padding of an existing header changes
+                        changed = True
+                        break
+                self.header_lengths[c] = lengths
+        return changed
+
+    def _normalize_cells(self, raw):
+        # same as normalize_column, for one row
+        cells = []
+        for c, cdata in enumerate(raw):
+            if cdata is t2t.MISSING:
+                cdata = uniquebool.FALSE if self.types[c] == 'bool' else None
+            elif type(cdata) is list:
+                pad_len = self.header_lengths[c].get(tuple(cdata), len(cdata))
+                if pad_len > len(cdata):
+                    cdata = cdata + [None] * (pad_len - len(cdata))
+            cells.append(cdata)
+        return cells
+
+    def _row_key(self, cells):
+        return tuple([t2t.sort_key(cells[c]) for c in self.sort_order])
+
+    def _replace_rows(self, p, n_removed, new_cells):
+        """
+        Replaces rows [p, p + n_removed) of columns with new_cells (at most
+        one row is added or removed), and updates the row tree and table to match.
+        """
+        columns = self.columns
+        n_old = columns.n_rows
+        delta = len(new_cells) - n_removed
+        if n_old == 0 or n_old + delta == 0:
+            # an empty row tree still has one (blank) row
+            self._rebuild()
+            return
+
+        # Follow the partition path of the changed row down the tree while the
+        # row only grows or shrinks an existing partition.
+        node = self.row_tree
+        start, end = 0, n_old
+        out_start = 0
+        n_cols = len(columns.values)
+        for c in range(n_cols - 1):
+            children = node.children
+            starts = [child.row_start for child in children]
+            values = columns.values[c]
+            child = None
+            if new_cells:
+                cdata = new_cells[0][c]
+                if p > start and values[p-1] == cdata:
+                    # joins the end of the partition before it
+                    child = _partition(children, starts, p - 1)
+                elif p < end and values[p] == cdata:
+                    # joins the start of the partition after it
+                    child = _partition(children, starts, p)
+            else:
+                child = _partition(children, starts, p)
+                if child.height == 1:
+                    child = None
+            if child is None:
+                break
+            i = children.index(child)
+            if delta:
+                # rows after the partition move
+                for moved in _iter_nodes(children[i+1:]):
+                    moved.row_start += delta
+            out_start += sum([sibling.descendants for sibling in children[:i]])
+            node = child
+            start, end = child.row_start, child.row_start + child.height
+            child.height += delta
+        else:
+            c = n_cols - 1
+
+        self._repartition(node, c, start, end, p, n_removed, new_cells, out_start)
+
+    def _repartition(self, node, c, start, end, p, n_removed, new_cells, out_start):
+        """
+        Rebuilds the sub-partitions of node (by col c onwards) next to the change
+        node -- partition containing the change (by the cols before c)
+        start, end -- rows of node before the change
+        out_start -- table row of node
+        """
+        columns = self.columns
+        children = node.children
+        starts = [child.row_start for child in children]
+        values = columns.values[c]
+        delta = len(new_cells) - n_removed
+
+        # Window of partitions to re-partition (old row numbers).
+        # Starts at the partition before the change, as the first changed
+        # row may merge into it, and ends after the partition following
+        # the change, which may merge into the last changed row.
+        q = p + n_removed
+        a = _partition(children, starts, p - 1).row_start if p > start else start
+        b = end
+        if q < end:
+            child = _partition(children, starts, q)
+            b = child.row_start + child.height
+
+        # Hierarchy headers are inserted based on the last hierarchy before
+        # each row, so if the change adds or removes one, extend the window
+        # until there is an unchanged hierarchy to go by.
+        changed_lists = [cdata for cdata in values[p:q] if type(cdata) is list]
+        changed_lists += [cells[c] for cells in new_cells if type(cells[c]) is list]
+        if changed_lists:
+            while b < end and not any([type(cdata) is list for cdata in values[q:b]]):
+                child = _partition(children, starts, b)
+                b = child.row_start + child.height
+
+        i0 = bisect.bisect_left(starts, a)
+        i1 = bisect.bisect_left(starts, b)
+
+        if delta:
+            # rows after the window move
+            for moved in _iter_nodes(children[i1:]):
+                moved.row_start += delta
+
+        out_start += sum([child.descendants for child in children[:i0]])
+        removed = node.remove_children(i0, i1)
+        out_end = out_start + sum([child.descendants for child in removed])
+
+        for col, col_values in enumerate(columns.values):
+            col_values[p:q] = [cells[col] for cells in new_cells]
+        columns.n_rows += delta
+        if node is self.row_tree:
+            node.height += delta
+        b += delta
+
+        # re-partition the window, continuing from the partition before it
+        prev = node.children[i0 - 1] if i0 > 0 else None
+        context = None
+        if any([type(cdata) is list for cdata in values[a:b]]):
+            context = []
+            for r in range(a - 1, start - 1, -1):
+                if type(values[r]) is list:
+                    context = values[r][:-1]
+                    break
+        holder = t2t.DataNode('Root')
+        sweep = []
+        t2t.partition_rows(holder, values, a, b, c == len(columns.values) - 1, sweep, prev, context)
+        t2t.partition_columns(columns, sweep, c + 1)
+        added = list(holder.children)
+        node.insert_children(i0, added)
+
+        # fill and splice in just the window's table rows
+        window = self.table_class()
+        window.set_cols(self.table.n_cols)
+        window.set_data_rows(sum([child.descendants for child in added]))
+        window.build()
+        t2t.fill_data_cels(window, _Forest(added), c)
+        if i0 == 0:
+            # the first row also holds the cells of node and its ancestors
+            for col in range(c):
+                window.set_row_cell(0, col, self.table.get_row_cell(out_start, col),
+                                    self.table.get_row_indent(out_start, col))
+        self.table.replace_rows(out_start, out_end, window)
+        self.table.partition_rows = t2t.top_partition_rows(self.row_tree)
+        self._count_widths(self.cache.rows[out_start:out_end], -1)
+        self.cache.replace_rows(out_start, out_end, window)
+        self._count_widths(self.cache.rows[out_start:out_start + window.n_data_rows], 1)
+        self.lines[out_start:out_end] = [None] * window.n_data_rows
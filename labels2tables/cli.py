@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import argparse
+from . import core
+from . import tags2table as t2t
+from . import table as t
+from . import trace
+from .bibcache import BibCache
+
+def snapshot(path):
+    """
+    returns -- (mtime, size) of path, or None if it doesn't exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def watch(path, on_change, interval=0.5, debounce=0.5, max_events=None, sleep=time.sleep):
+    """
+    Polls path for changes. Calls on_change once the file has changed and
+    then stayed the same for debounce seconds, so that a burst of writes
+    (e.g. an editor saving, or a reference manager exporting) only
+    regenerates once.
+    path       -- file to watch
+    on_change  -- function() called after each settled change
+    interval   -- seconds between polls
+    debounce   -- seconds the file must stay unchanged
+    max_events -- stop after this many calls to on_change (default: never stop)
+    """
+    last = snapshot(path)
+    events = 0
+    while max_events is None or events < max_events:
+        sleep(interval)
+        current = snapshot(path)
+        if current == last:
+            continue
+        # wait for writes to settle
+        while True:
+            sleep(debounce)
+            settled = snapshot(path)
+            if settled == current:
+                break
+            current = settled
+        last = current
+        if current is None:
+            # deleted (or being replaced), wait for it to come back
+            continue
+        on_change()
+        events += 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='labels2tables',
+        description='Generate an academic summary table from the keywords of a bibtex file')
+    parser.add_argument('bib_file', help='bibtex file to read')
+    parser.add_argument('-o', '--output', help='file to write the table to (default: stdout)')
+    parser.add_argument('--format', choices=['txt', 'tsv', 'csv', 'latex'], default='txt', help='output format (default: txt)')
+    parser.add_argument('--flatten', action='store_true',
+                        help='tsv/csv: write every cell of every row, one col per hierarchy level')
+    parser.add_argument('--chunk-rows', type=int,
+                        help='latex: split the table into longtables of about this many rows')
+    parser.add_argument('--group', action='store_true',
+                        help='keep entries in the order first seen in the bibtex file (grouping equal '
+                             'keywords together) rather than sorting them')
+    parser.add_argument('-k', '--keyword-filter', default='',
+                        help="only use keywords that begin with this text")
+    parser.add_argument('--keyword-separator', default=':',
+                        help='separator of hierarchical keywords (default: :)')
+    parser.add_argument('-f', '--field', dest='fields', action='append',
+                        help='bibtex field to add as a col (repeatable, default: ID)')
+    parser.add_argument('--rename', action='append', metavar='OLD=NEW',
+                        help='rename a label or field (repeatable, default: ID=reference)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of processes to parse with (default: 1)')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache parsed entries between runs (always on with --watch)')
+    parser.add_argument('--cache-dir', help='cache directory (default: per-user cache directory)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, and regenerate the output whenever the bibtex file changes')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between checks for changes with --watch (default: 0.5)')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='seconds the bibtex file must stay unchanged before regenerating (default: 0.5)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print a breakdown of time spent in each stage to stderr')
+    args = parser.parse_args(argv)
+
+    if args.fields is None:
+        args.fields = ['ID']
+    if args.rename is None:
+        args.label_rename = {'ID': 'reference'}
+    else:
+        args.label_rename = {}
+        for rename in args.rename:
+            if '=' not in rename:
+                parser.error('--rename expects OLD=NEW, got {0!r}'.format(rename))
+            old, new = rename.split('=', 1)
+            args.label_rename[old] = new
+    if args.watch and not args.output:
+        parser.error('--watch needs an --output file')
+    return args
+
+def build(args, cache=None, tracer=None):
+    """
+    Generates the output table once
+    args   -- from parse_args
+    cache  -- optional BibCache
+    tracer -- optional trace.Tracer
+    """
+    labels = core.bib2labels(
+        args.bib_file,
+        keyword_filter=args.keyword_filter,
+        keyword_separator=args.keyword_separator,
+        label_rename=args.label_rename,
+        fields=args.fields,
+        cache=cache,
+        workers=args.workers,
+        tracer=tracer)
+    if args.group:
+        labels['sort_rows'] = False
+        labels['group_rows'] = True
+    if args.format in ('tsv', 'csv'):
+        dialect = 'excel-tab' if args.format == 'tsv' else 'excel'
+        if args.output:
+            core.labels2tsv(labels, args.output, args.flatten, dialect, tracer=tracer)
+        elif args.flatten:
+            headers, columns = t2t.tags2columns(labels, tracer)
+            t.TsvTable(dialect).write_flat(headers, columns, sys.stdout)
+        else:
+            table = t2t.tags2table(labels, tracer=tracer)
+            t.TsvTable(dialect).write(table, sys.stdout)
+    elif args.format == 'latex':
+        if args.output:
+            core.labels2latex(labels, args.output, chunk_rows=args.chunk_rows,
+                              label_rename=args.label_rename, tracer=tracer)
+        else:
+            table = t2t.tags2table(labels, tracer=tracer)
+            cite_cols = core.col_indexes(labels, [args.label_rename.get('ID', 'ID')])
+            t.LatexTable(args.chunk_rows, cite_cols).write(table, sys.stdout)
+    elif args.output:
+        core.labels2txt(labels, args.output, tracer=tracer)
+    else:
+        table = t2t.tags2table(labels, tracer=tracer)
+        t.TxtTable().write(table, sys.stdout)
+        sys.stdout.write('\n')
+
+def main(argv=None):
+    """
+    Console script entry point
+    argv    -- command line args (default: sys.argv[1:])
+    returns -- exit code
+    """
+    args = parse_args(argv)
+    cache = None
+    if args.cache or args.watch:
+        # in watch mode only the records changed by an edit are re-parsed
+        cache = BibCache(args.cache_dir, incremental=args.watch)
+
+    def run():
+        tracer = trace.StageReport() if args.profile else None
+        build(args, cache, tracer)
+        if tracer is not None:
+            tracer.print_report()
+
+    run()
+    if not args.watch:
+        return 0
+
+    def on_change():
+        try:
+            run()
+        except Exception as e:
+            # e.g. a half-finished edit, keep watching
+            sys.stderr.write('labels2tables: {0}: {1}\n'.format(type(e).__name__, e))
+            return
+        sys.stderr.write('labels2tables: regenerated {0}\n'.format(args.output))
+
+    sys.stderr.write('labels2tables: watching {0} (Ctrl-C to stop)\n'.format(args.bib_file))
+    try:
+        watch(args.bib_file, on_change, args.interval, args.debounce)
+    except KeyboardInterrupt:
+        pass
+    return 0
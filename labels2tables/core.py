@@ -1,8 +1,239 @@
 import os
+import sys
+import collections
 import bibtexparser
 import bibtexparser.customization
 from . import tags2table as t2t
 from . import table as t
+from . import trace
+
+def iter_bib_records(bib_file):
+    """
+    Splits a bibtex file into raw records, one at a time, without reading
+    the whole file into memory. Record boundaries are the same as used by
+    bibtexparser (any line beginning with '@' starts a new record).
+    bib_file -- path to bibtex file
+    returns  -- generator of record strings
+    """
+    with open(bib_file) as bibtex_file:
+        for record in split_records(bibtex_file):
+            yield record
+
+def split_records(lines):
+    """
+    lines   -- iterable of bibtex lines (including line endings)
+    returns -- generator of record strings (see iter_bib_records)
+    """
+    record = []
+    for line in lines:
+        if line.strip().startswith('@'):
+            if record:
+                yield "".join(record)
+            record = [line.lstrip()]
+        else:
+            record.append(line)
+    if record:
+        yield "".join(record)
+
+def create_parser(fields=None):
+    """
+    Creates a bibtexparser parser with the customizations used by labels2tables.
+    The parser remembers @string macros between calls to parse,
+    so records from the same file should be fed through the same parser.
+    fields  -- if given, only keywords and these fields are kept (and converted).
+               ID and ENTRYTYPE are always kept.
+    returns -- bibtexparser.bparser.BibTexParser
+    """
+    if fields is not None:
+        keep = set(['keyword'] + list(fields))
+    
+    def customizations(record):
+        if fields is not None:
+            # drop unused fields (e.g. abstract) before doing any work on them
+            used = dict((k, v) for k, v in record.items() if k in keep)
+            used = bibtexparser.customization.convert_to_unicode(used)
+            # keep the record non-empty, or bibtexparser will drop it
+            used.setdefault('ID', record['ID'])
+            used.setdefault('ENTRYTYPE', record['ENTRYTYPE'])
+            record = used
+        else:
+            # convert latex special characters (e.g. {\"a})
+            record = bibtexparser.customization.convert_to_unicode(record)
+        # turn keywords field into a list of keywords
+        record = bibtexparser.customization.keyword(record)
+        return record
+    
+    parser = bibtexparser.bparser.BibTexParser()
+    parser.customization = customizations
+    return parser
+
+def iter_bib_entries(bib_file, workers=1, fields=None):
+    """
+    Parses a bibtex file entry by entry.
+    Memory is bounded by the largest single record rather than the whole file.
+    bib_file -- path to bibtex file
+    workers  -- number of processes to parse with (see iter_bib_entries_parallel)
+    fields   -- if given, entries are reduced to keywords and these fields (see create_parser)
+    returns  -- generator of bibtexparser entry dicts
+    """
+    if workers > 1:
+        for entry in iter_bib_entries_parallel(bib_file, workers, fields=fields):
+            yield entry
+        return
+    
+    parser = create_parser(fields)
+    for record in iter_bib_records(bib_file):
+        for entry in parse_record(parser, record):
+            yield entry
+
+def parse_record(parser, record):
+    """
+    parser  -- parser returned by create_parser
+    record  -- raw bibtex record
+    returns -- list of entries in record
+    """
+    bib_database = parser.parse(record)
+    # comments and preambles are not used, don't let them accumulate
+    bib_database.comments = []
+    bib_database.preambles = []
+    return bib_database.entries
+
+def parse_chunk(records, strings, fields=None):
+    """
+    Parses a chunk of records in a worker process
+    records -- list of raw bibtex records
+    strings -- @string macros defined before the first record
+    fields  -- see create_parser
+    returns -- list of entries
+    """
+    entries = []
+    for record_entries in parse_records(records, strings, fields):
+        entries.extend(record_entries)
+    return entries
+
+def parse_records(records, strings, fields=None):
+    """
+    Same as parse_chunk, but keeps the entries of each record apart
+    returns -- list of lists of entries, one per record
+    """
+    parser = create_parser(fields)
+    parser.bib_database.strings = strings
+    return [parse_record(parser, record) for record in records]
+
+def iter_bib_entries_parallel(bib_file, workers, chunk_size=1024*1024, fields=None):
+    """
+    Parses a bibtex file using a pool of processes.
+    The file is split at record boundaries into chunks, and entries are
+    returned in the same order as a serial parse.
+    bib_file   -- path to bibtex file
+    workers    -- number of worker processes
+    chunk_size -- approximate number of characters of bibtex sent to a worker at once
+    fields     -- see create_parser
+    returns    -- generator of bibtexparser entry dicts
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    # @string macros apply to every record that follows them.
+    # Track them here (they are cheap to parse), and send each chunk the
+    # macros defined before it. Workers pick up macros defined within
+    # their own chunk as they go.
+    strings_parser = create_parser()
+    
+    pending = collections.deque()
+    with ProcessPoolExecutor(workers) as executor:
+        chunk = []
+        chunk_len = 0
+        chunk_strings = {}
+        for record in iter_bib_records(bib_file):
+            if not chunk:
+                chunk_strings = dict(strings_parser.bib_database.strings)
+            chunk.append(record)
+            chunk_len += len(record)
+            if record.lower().startswith('@string'):
+                parse_record(strings_parser, record)
+            
+            if chunk_len >= chunk_size:
+                pending.append(executor.submit(parse_chunk, chunk, chunk_strings, fields))
+                chunk = []
+                chunk_len = 0
+                # don't read too far ahead of the consumer
+                while len(pending) > 2 * workers:
+                    for entry in pending.popleft().result():
+                        yield entry
+        if chunk:
+            pending.append(executor.submit(parse_chunk, chunk, chunk_strings, fields))
+        while pending:
+            for entry in pending.popleft().result():
+                yield entry
+
+def entry2row(
+    entry,
+    keyword_filter = "",
+    keyword_separator = ":",
+    label_rename = {
+        "ID": "reference"
+    },
+    fields = ["ID"]):
+    """
+    Extracts a label row from a single parsed bibtex entry
+    entry   -- bibtexparser entry dict
+    returns -- row dict (see bib2labels for other args)
+    """
+    row = {}
+    
+    # Extract keywords
+    keywords = entry['keyword']
+    for keyword in keywords:
+        if not keyword.startswith(keyword_filter):
+            continue
+        col, cdata = keyword2cell(keyword, keyword_separator, label_rename)
+        row[col] = cdata
+    
+    add_fields(row, entry, fields, label_rename)
+    return row
+
+def keyword2cell(keyword, keyword_separator, label_rename):
+    """
+    keyword -- bibtex keyword (e.g. game:soccer)
+    returns -- (col, cell data). Hierarchical keywords give a list
+               (e.g. ('game', ['soccer'])), others give True.
+    """
+    sub_keywords = keyword.split(keyword_separator)
+    sub_keywords = [label_rename.get(k, k) for k in sub_keywords]
+    if len(sub_keywords) > 1:
+        head = sub_keywords[0]
+        tail = sub_keywords[1:]
+        return head, tail
+    else:
+        return keyword, True
+
+def add_fields(row, entry, fields, label_rename):
+    # extract extra fields
+    for field in fields:
+        field_rename = label_rename.get(field, field)
+        row[field_rename] = entry[field]
+
+def iter_bib_rows(
+    bib_file,
+    keyword_filter = "",
+    keyword_separator = ":",
+    label_rename = {
+        "ID": "reference"
+    },
+    fields = ["ID"],
+    cache = None,
+    workers = 1):
+    """
+    Streams label rows from a bibtex reference database, one entry at a time
+    (see bib2labels for args)
+    returns -- generator of row dicts
+    """
+    if cache is not None:
+        entries = cache.entries(bib_file, fields, workers)
+    else:
+        entries = iter_bib_entries(bib_file, workers, fields)
+    for entry in entries:
+        yield entry2row(entry, keyword_filter, keyword_separator, label_rename, fields)
 
 def bib2labels(
     bib_file,
@@ -11,7 +242,10 @@ def bib2labels(
     label_rename = {
         "ID": "reference"
     },
-    fields = ["ID"]):
+    fields = ["ID"],
+    cache = None,
+    workers = 1,
+    tracer = None):
     """
     Extracts a labels dict suitable for table generation from a bibtex reference database
     bib_file           -- path to bibtex file
@@ -19,55 +253,61 @@ def bib2labels(
     keyword_separator  -- character used to delimit hierarchical keyword
     label_rename       -- dictionary mapping old name to new name
     fields             -- additional bibtex fields to extract in addition to keywords
-    output_file        -- filename of output table
+    cache              -- optional bibcache.BibCache to reuse entries parsed on a previous run
+    workers            -- number of processes to parse the bibtex file with
+    tracer             -- optional trace.Tracer to receive per stage timings
     returns            -- labels dict
     """
-    with open(bib_file) as bibtex_file:
-        bibtex_str = bibtex_file.read()
-
-    def customizations(record):
-        # bibtexparser customizations
-        # convert latex special characters (e.g. {\"a})
-        record = bibtexparser.customization.convert_to_unicode(record)
-        # turn keywords field into a list of keywords
-        record = bibtexparser.customization.keyword(record)
-        return record
-    
-    parser = bibtexparser.bparser.BibTexParser()
-    parser.customization = customizations
-    bib_database = bibtexparser.loads(bibtex_str, parser=parser)
-    entries = bib_database.entries
-    
     rows = []
     cols_set = set()
     
-    for entry in entries:
-        row = {}
-        
-        # Extract keywords
-        keywords = entry['keyword']
-        for keyword in keywords:
-            if not keyword.startswith(keyword_filter):
-                continue
-            sub_keywords = keyword.split(keyword_separator)
-            sub_keywords = [label_rename.get(k, k) for k in sub_keywords]
-            if len(sub_keywords) > 1:
-                head = sub_keywords[0]
-                tail = sub_keywords[1:]
-                row[head] = tail
-                cols_set.add(head)
-            else:
-                row[keyword] = True
-                cols_set.add(keyword)
-        
-        # extract extra fields
-        for field in fields:
-            field_rename = label_rename.get(field, field)
-            row[field_rename] = entry[field]
-            cols_set.add(field_rename)
-        
+    span = trace.start(tracer, 'bib2labels')
+    for row in iter_bib_rows(bib_file, keyword_filter, keyword_separator, label_rename, fields, cache, workers):
+        cols_set.update(row)
         rows.append(row)
     
+    trace.end(span, rows=len(rows), cols=len(cols_set))
+    return labels_dict(rows, cols_set, fields, label_rename)
+
+def iter_lines(text):
+    """
+    returns -- generator of the lines of text, split like a file (on '\\n' only)
+    """
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+def bibtex2labels(
+    bibtex_str,
+    keyword_filter = "",
+    keyword_separator = ":",
+    label_rename = {
+        "ID": "reference"
+    },
+    fields = ["ID"]):
+    """
+    Same as bib2labels, for bibtex that has already been read
+    bibtex_str -- bibtex text
+    returns    -- labels dict (see bib2labels for other args)
+    """
+    rows = []
+    cols_set = set()
+    parser = create_parser(fields)
+    for record in split_records(iter_lines(bibtex_str)):
+        for entry in parse_record(parser, record):
+            row = entry2row(entry, keyword_filter, keyword_separator, label_rename, fields)
+            cols_set.update(row)
+            rows.append(row)
+    return labels_dict(rows, cols_set, fields, label_rename)
+
+def labels_dict(rows, cols_set, fields, label_rename):
+    """
+    rows     -- row dicts
+    cols_set -- set of every col used by rows
+    returns  -- labels dict (see bib2labels for other args)
+    """
     cols = sorted(cols_set)
     
     # leave rest to inference
@@ -76,8 +316,6 @@ def bib2labels(
         #       atomatically group mutually exculsive cols
         #       into hierarchies.
         'cols': cols,
-        # TODO: Allow way to specify that source col should
-        #       be sorted last (perhaps a "sort-hint" col attribute)
         # TODO: Allow types to be dict so that we can
         #       specify ref type without needing to know
         #       how many columns in advance
@@ -85,45 +323,252 @@ def bib2labels(
         #    label_rename.get("ID", "ID"): "ref"
         #},
         'sort_rows': True,
+        # sort by keywords first, so that the reference
+        # col doesn't break up keyword partitions
+        'sort_last': [label_rename.get(field, field) for field in fields],
         'data': rows,
     }
     
     return lables_dict
 
+class FilterTrie(object):
+    """
+    Character trie over keyword filters, so the filters a keyword matches
+    are found in a single walk along the keyword
+    (rather than a startswith per filter).
+    """
+    def __init__(self, filters):
+        """
+        filters -- list of keyword_filter prefixes
+        """
+        # node: [char -> child node, indexes of filters ending at this node]
+        self.root = [{}, []]
+        for i, prefix in enumerate(filters):
+            node = self.root
+            for ch in prefix:
+                node = node[0].setdefault(ch, [{}, []])
+            node[1].append(i)
+    
+    def matches(self, keyword):
+        """
+        returns -- indexes of the filters that keyword begins with
+        """
+        node = self.root
+        result = list(node[1])
+        for ch in keyword:
+            node = node[0].get(ch)
+            if node is None:
+                break
+            result.extend(node[1])
+        return result
+
+def labels_config(config):
+    """
+    config  -- dict of bib2labels args (keyword_filter, keyword_separator,
+               label_rename and fields), or just a keyword_filter string
+    returns -- dict with all four args (bib2labels defaults filled in)
+    """
+    if not isinstance(config, dict):
+        config = {'keyword_filter': config}
+    result = {
+        'keyword_filter': "",
+        'keyword_separator': ":",
+        'label_rename': {
+            "ID": "reference"
+        },
+        'fields': ["ID"],
+    }
+    result.update(config)
+    return result
+
+def bib2labels_multi(
+    bib_file,
+    configs,
+    cache = None,
+    workers = 1,
+    tracer = None):
+    """
+    Extracts one labels dict per config from a single parse of a bibtex file.
+    Same result as calling bib2labels once per config, but each keyword is
+    matched against all the keyword filters with one trie lookup.
+    bib_file -- path to bibtex file
+    configs  -- list of configs (see labels_config)
+    returns  -- list of labels dicts, one per config
+    (see bib2labels for other args)
+    """
+    configs = [labels_config(config) for config in configs]
+    # parse every field any table uses
+    fields = []
+    for config in configs:
+        for field in config['fields']:
+            if field not in fields:
+                fields.append(field)
+    trie = FilterTrie([config['keyword_filter'] for config in configs])
+    
+    tables_rows = [[] for config in configs]
+    tables_cols = [set() for config in configs]
+    
+    span = trace.start(tracer, 'bib2labels')
+    if cache is not None:
+        entries = cache.entries(bib_file, fields, workers)
+    else:
+        entries = iter_bib_entries(bib_file, workers, fields)
+    for entry in entries:
+        rows = [{} for config in configs]
+        for keyword in entry['keyword']:
+            for i in trie.matches(keyword):
+                config = configs[i]
+                col, cdata = keyword2cell(keyword, config['keyword_separator'], config['label_rename'])
+                rows[i][col] = cdata
+        for i, config in enumerate(configs):
+            row = rows[i]
+            add_fields(row, entry, config['fields'], config['label_rename'])
+            tables_cols[i].update(row)
+            tables_rows[i].append(row)
+    trace.end(span, rows=len(tables_rows[0]) if configs else 0, tables=len(configs))
+    
+    return [labels_dict(tables_rows[i], tables_cols[i], config['fields'], config['label_rename'])
+            for i, config in enumerate(configs)]
+
 def labels2txt(
     labels,
-    output_file):
+    output_file,
+    tracer = None):
     """
     Generate plaintext table
     labels      -- labels dict
     output_file -- filename of output table
+    tracer      -- optional trace.Tracer to receive per stage timings
     """
-    table = t2t.tags2table(labels)
+    table = t2t.tags2table(labels, tracer=tracer)
     presenter = t.TxtTable()
-    txt = presenter.present(table)
+    span = trace.start(tracer, 'write')
     with open(output_file, 'w') as out:
-        out.write(txt)
-
-#def labels2tsv(
-#    labels,
-#    output_file):
-#    """
-#    Generate tab separated value table
-#    labels      -- labels dict
-#    output_file -- filename of output table
-#    """
-#    pass
-
-#def labels2latex(
-#    labels,
-#    output_file,
-#    output_wrapper,
-#    bib_file):
-#    """
-#    Generate LaTeX table
-#    labels         -- labels dict
-#    output_file    -- filename of output LaTeX table
-#    output_wrapper -- filename of output LaTeX wrapper to compile table
-#    bib_file       -- bib filename for LaTeX wapper to use for citations keys
-#    """
-#    pass
+        presenter.write(table, out)
+    trace.end(span, rows=table.n_data_rows)
+
+def labels2text(labels):
+    """
+    labels  -- labels dict
+    returns -- plaintext table, as written by labels2txt
+    """
+    return t.TxtTable().present(t2t.tags2table(labels))
+
+def preview(
+    labels,
+    max_rows = 50,
+    tracer = None):
+    """
+    Plaintext preview of the top of a table, without building the rest.
+    The rows shown match the first rows of labels2txt (col widths fit just these rows).
+    labels   -- labels dict
+    max_rows -- number of table rows to show (at least 1)
+    tracer   -- optional trace.Tracer to receive per stage timings
+    returns  -- table text
+    """
+    table = t2t.tags2table(labels, tracer=tracer, max_rows=max_rows)
+    return t.TxtTable().present(table)
+
+def labels2tsv(
+    labels,
+    output_file,
+    flatten = False,
+    dialect = 'excel-tab',
+    tracer = None):
+    """
+    Generate tab separated value table
+    labels      -- labels dict
+    output_file -- filename of output table
+    flatten     -- write every cell of every data row (one col per hierarchy
+                   level), rather than the table as laid out for display
+    dialect     -- csv dialect ('excel' for comma separated values)
+    tracer      -- optional trace.Tracer to receive per stage timings
+    """
+    presenter = t.TsvTable(dialect)
+    if flatten:
+        # no need for the row tree
+        headers, columns = t2t.tags2columns(labels, tracer)
+    else:
+        table = t2t.tags2table(labels, tracer=tracer)
+    span = trace.start(tracer, 'write')
+    if sys.version_info[0] < 3:
+        out = open(output_file, 'wb')
+    else:
+        out = open(output_file, 'w', newline='')
+    with out:
+        if flatten:
+            presenter.write_flat(headers, columns, out)
+        else:
+            presenter.write(table, out)
+    trace.end(span)
+
+def col_indexes(labels, top_cols):
+    """
+    labels   -- labels dict
+    top_cols -- top level col names
+    returns  -- indexes of the table cols under any of top_cols
+    """
+    col_chains = t2t.set_headers(labels['cols'], None, None)[1]
+    return [c for c, chain in enumerate(col_chains) if chain[0] in top_cols]
+
+def labels2latex(
+    labels,
+    output_file,
+    output_wrapper = None,
+    bib_file = None,
+    cite_cols = None,
+    chunk_rows = None,
+    chunk_files = False,
+    label_rename = {
+        "ID": "reference"
+    },
+    tracer = None):
+    """
+    Generate LaTeX table
+    labels         -- labels dict
+    output_file    -- filename of output LaTeX table
+    output_wrapper -- filename of output LaTeX wrapper to compile table (optional)
+    bib_file       -- bib filename for LaTeX wapper to use for citations keys
+    cite_cols      -- top level cols of citation keys (written as \\cite{key}),
+                      default: the ID col (as renamed by label_rename)
+    chunk_rows     -- split the table into longtables of about this many rows
+                      (at top level partition boundaries)
+    chunk_files    -- write each chunk to its own file (output_file-1.tex, ...),
+                      and make output_file \\input them
+    label_rename   -- label_rename the labels were made with (see bib2labels)
+    tracer         -- optional trace.Tracer to receive per stage timings
+    """
+    if cite_cols is None:
+        cite_cols = [label_rename.get("ID", "ID")]
+    table = t2t.tags2table(labels, tracer=tracer)
+    presenter = t.LatexTable(chunk_rows, cite_cols=col_indexes(labels, cite_cols))
+    
+    # \\input paths are relative to the document being compiled
+    tex_dir = os.path.dirname(os.path.abspath(output_wrapper or output_file))
+    def tex_path(path):
+        path = os.path.relpath(os.path.abspath(path), tex_dir).replace(os.sep, '/')
+        return os.path.splitext(path)[0]
+    
+    span = trace.start(tracer, 'write')
+    if chunk_files:
+        root, ext = os.path.splitext(output_file)
+        paths = presenter.write_files(table, root + '-{0}' + (ext or '.tex'))
+        with open(output_file, 'w') as out:
+            for path in paths:
+                out.write('\\input{' + tex_path(path) + '}\n')
+    else:
+        with open(output_file, 'w') as out:
+            presenter.write(table, out)
+    trace.end(span, rows=table.n_data_rows)
+    
+    if output_wrapper is not None:
+        with open(output_wrapper, 'w') as out:
+            out.write('\\documentclass{article}\n')
+            out.write('\\usepackage[utf8]{inputenc}\n')
+            out.write('\\usepackage{longtable}\n')
+            out.write('\\begin{document}\n')
+            out.write('\\input{' + tex_path(output_file) + '}\n')
+            if bib_file is not None:
+                out.write('\\bibliographystyle{plain}\n')
+                out.write('\\bibliography{' + tex_path(bib_file) + '}\n')
+            out.write('\\end{document}\n')
@@ -0,0 +1,151 @@
+from . import core
+from .bibcache import extract_entry
+
+class _IndexNode(object):
+    __slots__ = ('children', 'exact', 'below')
+
+    def __init__(self):
+        self.children = {} # segment -> _IndexNode
+        self.exact = []    # entries with this exact keyword
+        self.below = []    # entries with this keyword or one below it
+
+def _post(postings, i):
+    # entries are added in order, so a repeat can only be the last one
+    if not postings or postings[-1] != i:
+        postings.append(i)
+
+class KeywordIndex(object):
+    """
+    In-memory index of the keywords of a bibliography, for answering many
+    queries without re-parsing or rebuilding tables.
+    Keywords are split into segments (model:network:centrality ->
+    model, network, centrality) and stored in a prefix tree.
+    Each node has posting lists of the entries (by index in file order)
+    carrying that keyword, or a keyword below it.
+
+    Patterns:
+    model:network    -- entries with exactly that keyword
+    model:network:*  -- entries with model:network or any keyword below it
+    """
+    def __init__(self, entries, fields=["ID"], keyword_separator=":"):
+        """
+        entries           -- parsed bibtex entries (e.g. from core.iter_bib_entries)
+        fields            -- bibtex fields to keep for building labels dicts
+        keyword_separator -- character used to delimit hierarchical keyword
+        """
+        self.fields = list(fields)
+        self.keyword_separator = keyword_separator
+        self.entries = []
+        self.root = _IndexNode()
+        for i, entry in enumerate(entries):
+            self.entries.append(extract_entry(entry, fields))
+            for keyword in entry['keyword']:
+                node = self.root
+                _post(node.below, i)
+                for segment in keyword.split(keyword_separator):
+                    child = node.children.get(segment)
+                    if child is None:
+                        child = node.children[segment] = _IndexNode()
+                    node = child
+                    _post(node.below, i)
+                _post(node.exact, i)
+
+        # freeze posting lists into sets, for fast intersection
+        self.all = frozenset(range(len(self.entries)))
+        sweep = [self.root]
+        while sweep:
+            sweep_next = []
+            for node in sweep:
+                node.exact = frozenset(node.exact)
+                node.below = frozenset(node.below)
+                sweep_next.extend(node.children.values())
+            sweep = sweep_next
+
+    def match(self, pattern):
+        """
+        pattern -- keyword, or keyword prefix ending in :* (see KeywordIndex)
+        returns -- frozenset of indexes of matching entries
+        """
+        segments = pattern.split(self.keyword_separator)
+        below = segments[-1] == '*'
+        if below:
+            segments = segments[:-1]
+        node = self.root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return frozenset()
+        return node.below if below else node.exact
+
+    def children(self, pattern=''):
+        """
+        pattern -- keyword (default: top level)
+        returns -- sorted list of the segments directly below the keyword
+        """
+        node = self.root
+        if pattern:
+            for segment in pattern.split(self.keyword_separator):
+                node = node.children.get(segment)
+                if node is None:
+                    return []
+        return sorted(node.children)
+
+    def query(self, include=(), exclude=()):
+        """
+        include -- patterns every matching entry must match (conjunction)
+        exclude -- patterns no matching entry may match (negation)
+        returns -- list of indexes of matching entries, in file order
+        """
+        sets = sorted([self.match(pattern) for pattern in include], key=len)
+        if sets:
+            # intersect smallest first, so the working set only shrinks
+            result = sets[0]
+            for postings in sets[1:]:
+                if not result:
+                    break
+                result = result & postings
+        else:
+            result = self.all
+        for pattern in exclude:
+            if not result:
+                break
+            result = result - self.match(pattern)
+        return sorted(result)
+
+    def labels(
+        self,
+        include = (),
+        exclude = (),
+        keyword_filter = "",
+        label_rename = {
+            "ID": "reference"
+        }):
+        """
+        Labels dict for the entries matching a query
+        include, exclude -- see query
+        returns          -- labels dict (see core.bib2labels for other args)
+        """
+        rows = []
+        cols_set = set()
+        for i in self.query(include, exclude):
+            row = core.entry2row(self.entries[i], keyword_filter, self.keyword_separator, label_rename, self.fields)
+            cols_set.update(row)
+            rows.append(row)
+        return core.labels_dict(rows, cols_set, self.fields, label_rename)
+
+def bib2index(
+    bib_file,
+    fields = ["ID"],
+    keyword_separator = ":",
+    cache = None,
+    workers = 1):
+    """
+    Builds a KeywordIndex of a bibtex reference database
+    bib_file -- path to bibtex file
+    returns  -- KeywordIndex (see core.bib2labels for other args)
+    """
+    if cache is not None:
+        entries = cache.entries(bib_file, fields, workers)
+    else:
+        entries = core.iter_bib_entries(bib_file, workers, fields)
+    return KeywordIndex(entries, fields, keyword_separator)
@@ -1,3 +1,6 @@
+import re
+import csv
+import itertools
 from . import uniquebool
 
 def create_matrix(n_rows, n_cols, fill):
@@ -22,6 +25,9 @@ class Table:
         self.head_stretch = []
         self.data = []
         self.data_indent = []
+        # data rows of each top level partition of the row tree, in order
+        # (set by tags2table, None if unknown)
+        self.partition_rows = None
         self.built = False
 
     # Table construction
@@ -63,11 +69,297 @@ class Table:
         assert self.built
         return ((self.n_header_rows, self.n_data_rows), self.n_cols)
 
+    def get_row_cell(self, r, c):
+        assert self.built
+        return self.data[r][c]
+
+    def get_row_indent(self, r, c):
+        assert self.built
+        return self.data_indent[r][c]
+
+    def get_header_cell(self, r, c):
+        assert self.built
+        return self.head[r][c]
+
+    def get_header_stretch(self, r, c):
+        assert self.built
+        return self.head_stretch[r][c]
+
     def iter_rows(self):
         assert self.built
         for r in self.data:
             yield r
 
+    def iter_row_cells(self, start=0, end=None):
+        """
+        start -- first data row
+        end -- end of data rows (excluded, default: all)
+        returns -- generator of [c, txt, c, txt, ...] lists (one per data row)
+                   of the cells that are not blank
+        """
+        assert self.built
+        for row in self.data[start:end]:
+            cells = []
+            for c, txt in enumerate(row):
+                if not is_blank(txt):
+                    cells.append(c)
+                    cells.append(txt)
+            yield cells
+
+    def replace_rows(self, start, end, other):
+        """
+        Replaces data rows [start, end) with all data rows of another table
+        (rows after end are shifted up or down)
+        other -- built Table with the same number of cols
+        """
+        assert self.built and other.built
+        assert other.n_cols == self.n_cols
+        rows = [list(row) for row in other.iter_rows()]
+        indents = [[other.get_row_indent(r, c) for c in range(other.n_cols)]
+                   for r in range(other.n_data_rows)]
+        self.data[start:end] = rows
+        self.data_indent[start:end] = indents
+        self.n_data_rows = len(self.data)
+        # (the caller knows the new partitions, if anyone)
+        self.partition_rows = None
+
+def is_blank(txt):
+    # Invisible cell (empty string).
+    # Checks type first, as == may not be defined for all cell data.
+    return type(txt) is str and txt == ''
+
+class SparseTable(Table):
+    """
+    Table that only stores data cells that are not blank.
+    The row tree merges repeated values into partitions, leaving most data
+    cells blank, so memory scales with the number of non-blank cells rather
+    than n_data_rows x n_cols. Headers are few, so are still stored dense.
+    """
+    def build(self):
+        self.head = create_matrix(self.n_header_rows, self.n_cols, '')
+        self.head_stretch = create_matrix(self.n_header_rows, self.n_cols, 1)
+        # per row: None, or a flat [c, txt, c, txt, ...] list in column order
+        self.data = [None] * self.n_data_rows
+        # (r, c) -> indent, for the rare non-zero indents
+        self.data_indent = {}
+        self.built = True
+
+    def set_row_cell(self, r, c, txt, indent=0):
+        assert self.built
+        if indent:
+            self.data_indent[(r, c)] = indent
+        else:
+            self.data_indent.pop((r, c), None)
+        
+        cells = self.data[r]
+        if cells is None:
+            if is_blank(txt):
+                return
+            self.data[r] = [c, txt]
+            return
+        
+        # cells are normally set in column order, so search from the end
+        i = len(cells) - 2
+        while i >= 0 and cells[i] > c:
+            i -= 2
+        if i >= 0 and cells[i] == c:
+            if is_blank(txt):
+                del cells[i:i+2]
+            else:
+                cells[i+1] = txt
+        elif not is_blank(txt):
+            cells[i+2:i+2] = [c, txt]
+
+    def get_row_cell(self, r, c):
+        assert self.built
+        cells = self.data[r]
+        if cells is not None:
+            for i in range(0, len(cells), 2):
+                if cells[i] == c:
+                    return cells[i+1]
+        return ''
+
+    def get_row_indent(self, r, c):
+        assert self.built
+        return self.data_indent.get((r, c), 0)
+
+    def iter_rows(self):
+        assert self.built
+        # expand one row at a time
+        for cells in self.data:
+            row = [''] * self.n_cols
+            if cells is not None:
+                for i in range(0, len(cells), 2):
+                    row[cells[i]] = cells[i+1]
+            yield row
+
+    def iter_row_cells(self, start=0, end=None):
+        assert self.built
+        for cells in self.data[start:end]:
+            yield cells if cells is not None else []
+
+    def replace_rows(self, start, end, other):
+        assert self.built and other.built
+        assert other.n_cols == self.n_cols
+        rows = [list(cells) or None for cells in other.iter_row_cells()]
+        delta = len(rows) - (end - start)
+        # shift indents of the rows after the replaced ones
+        indents = {}
+        for (r, c), amount in self.data_indent.items():
+            if r < start:
+                indents[(r, c)] = amount
+            elif r >= end:
+                indents[(r + delta, c)] = amount
+        for r in range(other.n_data_rows):
+            for c in range(other.n_cols):
+                amount = other.get_row_indent(r, c)
+                if amount:
+                    indents[(start + r, c)] = amount
+        self.data[start:end] = rows
+        self.data_indent = indents
+        self.n_data_rows = len(self.data)
+        self.partition_rows = None
+
+class DisplayCache:
+    """
+    Display strings for every header and non-blank data cell of a table,
+    each converted exactly once.
+    Presenters that display cells the same way can share one cache
+    (e.g. a width pass and a render pass, or several output formats).
+    """
+    def __init__(self, table, display):
+        """
+        table -- built Table
+        display -- function(cell data) -> string
+        """
+        self.display = display
+        self.n_cols = table.n_cols
+        # Many cells hold identical values (e.g. blanks, Y/N, repeated years),
+        # so only convert each distinct value once.
+        self._memo = {}
+        self.head = [self._display_row(row) for row in table.head]
+        # per data row: flat [c, txt, c, txt, ...] list of non-blank cells
+        self.rows = self._display_rows(table)
+
+    def _display_rows(self, table):
+        rows = []
+        for cells in table.iter_row_cells():
+            display_cells = list(cells)
+            display_cells[1::2] = self._display_row(cells[1::2])
+            rows.append(display_cells)
+        return rows
+
+    def replace_rows(self, start, end, table):
+        """
+        Keeps the cache in step with Table.replace_rows,
+        only converting the cells of the new rows.
+        start, end -- data rows replaced (end excluded)
+        table -- built Table holding just the new rows
+        """
+        self.rows[start:end] = self._display_rows(table)
+
+    def _display_row(self, row):
+        memo = self._memo
+        display = self.display
+        result = []
+        for cell_data in row:
+            if type(cell_data) is list:
+                # hierarchy
+                key = (list, tuple((type(x), x) for x in cell_data))
+            else:
+                # Need the types, else key False == key 0 and key True == key 1.
+                key = (type(cell_data), cell_data)
+            try:
+                txt = memo[key]
+            except KeyError:
+                txt = memo[key] = display(cell_data)
+            except TypeError:
+                # unhashable
+                txt = display(cell_data)
+            result.append(txt)
+        return result
+
+    def get_header(self, hr, c):
+        return self.head[hr][c]
+
+    def get_cell(self, r, c):
+        cells = self.rows[r]
+        for i in range(0, len(cells), 2):
+            if cells[i] == c:
+                return cells[i+1]
+        return ''
+
+    def get_row(self, r):
+        """
+        returns -- display row r (blank cells are '')
+        """
+        cells = self.rows[r]
+        row = [''] * self.n_cols
+        for i in range(0, len(cells), 2):
+            row[cells[i]] = cells[i+1]
+        return row
+
+    def iter_rows(self):
+        """
+        returns -- generator of display rows (blank cells are '')
+        """
+        for r in range(len(self.rows)):
+            yield self.get_row(r)
+
+    def col_widths(self):
+        """
+        returns -- widest data cell in each col
+        """
+        widths = [0] * self.n_cols
+        for cells in self.rows:
+            for i in range(0, len(cells), 2):
+                c = cells[i]
+                width = len(cells[i+1])
+                if width > widths[c]:
+                    widths[c] = width
+        return widths
+
+# Need the types, else key False == key 0 and key True == key 1.
+_display_map = {
+    (uniquebool.UniqueBool, uniquebool.TRUE): 'Y',
+    (uniquebool.UniqueBool, uniquebool.FALSE): 'N',
+    # Type of None is NoneType, but NoneType isn't exposed in Python3
+    (type(None), None): '-'
+}
+
+def display_value(td):
+    """
+    td -- single (not hierarchy) cell value
+    returns -- string shown for the value
+    """
+    key = (type(td), td)
+    if key in _display_map:
+        return _display_map[key]
+    return str(td)
+
+def display_cell(td, indent=0, indent_str=" ", escape=None):
+    """
+    Text of a cell, as shown by every presenter
+    td -- data to display
+    indent -- levels of indent
+    indent_str -- written once per level of indent
+    escape -- optional function to escape the text (not the indent) with
+    returns -- string
+    """
+    if type(td) is list:
+        if len(td) == 0:
+            # empty list, will be represented as '-'
+            td = None
+        else:
+            # hierarchy, display final element with indent
+            indent += len(td) - 1
+            td = td[-1]
+    
+    text = display_value(td)
+    if escape is not None:
+        text = escape(text)
+    return indent_str * indent + text
+
 class TableFormatter:
     """
     Graphically/Textually presents the data in a table
@@ -76,10 +368,11 @@ class TableFormatter:
 
 class TxtTable(TableFormatter):
     class DimensionedTable:
-        def __init__(self, table):
+        def __init__(self, table, cache=None):
             # copy table functionality
             self.iter_rows = table.iter_rows
             self.get_dims = table.get_dims
+            self.get_row_cell = table.get_row_cell
 
             # copy table properties
             self.n_cols = table.n_cols
@@ -87,9 +380,12 @@ class TxtTable(TableFormatter):
             self.n_header_rows = table.n_header_rows
             self.head = table.head
             self.head_stretch = table.head_stretch
-            self.data = table.data
-            self.data_indent = table.data_indent
             self.built = table.built
+            self.cache = cache
+            if cache is not None:
+                self.head_txt = cache.head
+            else:
+                self.head_txt = [[TxtTable._display(txt) for txt in row] for row in table.head]
 
             # own properties
             self.col_width = []
@@ -103,21 +399,67 @@ class TxtTable(TableFormatter):
                 # initialize col widths to 0
                 self.min_col_right_pos.append(0)
         def get_header(self, hr, c):
-            return self.display(self.head[hr][c])
+            return self.head_txt[hr][c]
         def get_cell(self, r, c):
-            return self.display(self.data[r][c])
+            if self.cache is not None:
+                return self.cache.get_cell(r, c)
+            return TxtTable._display(self.get_row_cell(r, c))
         def display(self, cell_data):
             return TxtTable._display(cell_data)
 
     def __init__(self):
         pass
 
-    def present(self, table):
+    @classmethod
+    def display_cache(cls, table):
         """
         table -- table.Table
+        returns -- DisplayCache of cells as displayed by TxtTable
+        """
+        return DisplayCache(table, cls._display)
+
+    def present(self, table, cache=None):
+        """
+        table -- table.Table
+        cache -- optional DisplayCache from display_cache (reused if given)
         returns -- table formated as text
         """
-        dims = TxtTable.DimensionedTable(table)
+        return "\n".join(self.iter_lines(table, cache))
+
+    def write(self, table, fp, cache=None):
+        """
+        Writes table to a file object one line at a time
+        (same text as present, without building it in memory)
+        table -- table.Table
+        fp -- file object opened for writing text
+        cache -- optional DisplayCache from display_cache (reused if given)
+        """
+        first = True
+        for line in self.iter_lines(table, cache):
+            if not first:
+                fp.write("\n")
+            fp.write(line)
+            first = False
+
+    def measure(self, table, cache=None, data_widths=None):
+        """
+        Width pass: finds the width of each column
+        table -- table.Table
+        cache -- optional DisplayCache from display_cache (reused if given,
+                 else cells are displayed one row at a time, and not kept)
+        data_widths -- optional widest data cell of each col, if already known
+                       (then only the header cells are measured)
+        returns -- DimensionedTable
+        """
+        dims = TxtTable.DimensionedTable(table, cache)
+        if data_widths is None and cache is not None:
+            data_widths = cache.col_widths()
+        elif data_widths is None:
+            data_widths = [0] * dims.n_cols
+            for row in self._iter_display_rows(table):
+                for c, contents in enumerate(row):
+                    if len(contents) > data_widths[c]:
+                        data_widths[c] = len(contents)
 
         left_pos = 0
         # find minimum size of each column (greedily take smallest possible, starting from leftmost column)
@@ -129,8 +471,8 @@ class TxtTable(TableFormatter):
                 curr = dims.min_col_right_pos[c_right_edge]
                 dims.min_col_right_pos[c_right_edge] = max(curr, min_cell_right_pos)
 
-            for r in range(dims.n_data_rows):
-                cell_width = len(dims.get_cell(r, c))
+            if dims.n_data_rows:
+                cell_width = data_widths[c]
                 min_cell_right_pos = left_pos + cell_width
                 curr = dims.min_col_right_pos[c]
                 dims.min_col_right_pos[c] = max(curr, min_cell_right_pos)
@@ -138,15 +480,46 @@ class TxtTable(TableFormatter):
             dims.col_width[c] = dims.min_col_right_pos[c] - left_pos
             left_pos = dims.min_col_right_pos[c] + 1 # include 1 char padding
 
-        result = ""
+        return dims
+
+    def iter_lines(self, table, cache=None):
+        """
+        Renders table one line at a time (after a width pass over the whole table).
+        Without a cache, each row is displayed again as it is rendered, so
+        memory is bounded by one row rather than the whole table.
+        table -- table.Table
+        cache -- optional DisplayCache from display_cache (reused if given)
+        returns -- generator of lines of text (without newlines)
+        """
+        dims = self.measure(table, cache)
+        for line in self.iter_head_lines(dims):
+            yield line
+        col_widths = dims.col_width
+        if cache is not None:
+            rows = cache.iter_rows()
+        else:
+            rows = self._iter_display_rows(table)
+        for row in rows:
+            yield self.format_row(row, col_widths)
+        yield self.rule(dims)
+
+    def rule(self, dims):
+        """
+        dims -- DimensionedTable from measure
+        returns -- line across the whole table, above and below the data rows
+        """
         num_breaks = max(0, dims.n_cols - 1)
-        col_total_width = sum(dims.col_width)
-        table_width = col_total_width + num_breaks
-        result += "=" * table_width + "\n"
+        return "=" * (sum(dims.col_width) + num_breaks)
+
+    def iter_head_lines(self, dims):
+        """
+        dims -- DimensionedTable from measure
+        returns -- generator of lines, from the top rule to the rule below the header rows
+        """
+        yield self.rule(dims)
         for hr in range(dims.n_header_rows):
             padded_row = []
-            underlines = ""
-            underline_upto = 0
+            underlines = []
             c = 0
             while c < dims.n_cols:
                 stretch = dims.head_stretch[hr][c]
@@ -158,36 +531,39 @@ class TxtTable(TableFormatter):
                     stretch_total_width = sum(dims.col_width[c:c+stretch])
                     num_breaks = stretch - 1
                     col_width = stretch_total_width + num_breaks
-                    underlines += "-" * col_width
+                    underlines.append("-" * col_width)
 
                     padded_row.append(TxtTable._pad(contents, col_width))
 
                     c += stretch
-                    if c < dims.n_cols:
-                        underlines += " " # col separation
                 else:
                     col_width = dims.col_width[c]
-                    underlines += " " * col_width # no underline
+                    underlines.append(" " * col_width) # no underline
 
                     padded_row.append(TxtTable._pad(contents, col_width))
 
                     c += 1
-                    if c < dims.n_cols:
-                        underlines += " " # col separation
 
-            result += " ".join(padded_row) + "\n"
+            yield " ".join(padded_row) # col separation
             if hr < dims.n_header_rows - 1: # don't attempt to underline final row
-                result += underlines + "\n"
-        result += "=" * table_width + "\n"
-        for r in range(dims.n_data_rows):
-            padded_row = []
-            for c in range(dims.n_cols):
-                contents = dims.get_cell(r, c)
-                col_width = dims.col_width[c]
-                padded_row.append(TxtTable._pad(contents, col_width))
-            result += " ".join(padded_row) + "\n"
-        result += "=" * table_width
-        return result
+                yield " ".join(underlines)
+        yield self.rule(dims)
+
+    @classmethod
+    def format_row(cls, row, col_widths):
+        """
+        row -- display strings of a data row
+        col_widths -- col_width of a DimensionedTable
+        returns -- line of text
+        """
+        # (widths already fit every cell, so ljust never truncates)
+        return " ".join([contents.ljust(col_width) for contents, col_width in zip(row, col_widths)])
+
+    @classmethod
+    def _iter_display_rows(cls, table):
+        # same cell text as display_cache, one row at a time
+        # (which also leaves out indents)
+        return iter_display_rows(table, lambda td, indent: cls._display(td))
 
     @classmethod
     def _pad(cls, s, pad_length):
@@ -201,33 +577,7 @@ class TxtTable(TableFormatter):
         td -- data to display
         returns -- string
         """
-        
-        # Need the types, else key False == key 0 and key True == key 1.
-        conv_map = {
-            (uniquebool.UniqueBool, uniquebool.TRUE): 'Y',
-            (uniquebool.UniqueBool, uniquebool.FALSE): 'N',
-            # Type of None is NoneType, but NoneType isn't exposed in Python3
-            (type(None), None): '-'
-        }
-        
-        if type(td) is list:
-            if len(td) == 0:
-                # empty list, will be represented as '-'
-                td = None
-            else:
-                # hierarchy, display final element with indent
-                indent += len(td) - 1
-                td = td[-1]
-        
-        result = " " * indent
-        key = (type(td), td)
-        if key in conv_map:
-            td = conv_map[key]
-            result += td
-        else:
-            result += str(td)
-        
-        return result
+        return display_cell(td, indent)
 
     def cmp(self, txta, txtb):
         """
@@ -245,3 +595,273 @@ class TxtTable(TableFormatter):
         txtb = '\n'.join([l.rstrip() for l in txtb.split('\n')])
         
         return txta.strip() == txtb.strip()
+
+def iter_display_rows(table, display, col_display={}):
+    """
+    Converts data rows to display strings one row at a time
+    (rather than all at once like DisplayCache).
+    table -- table.Table
+    display -- function(cell data, indent) -> string
+    col_display -- col -> display function, for cols to display differently
+                   (these are not memoized)
+    returns -- generator of lists of strings (blank cells are '')
+    """
+    # Bool, None and hierarchy cells repeat a small set of keyword values,
+    # so only convert each of those once. Other cells (e.g. references)
+    # may be different in every row, so memoizing them would grow with
+    # the number of rows. They are converted every time instead.
+    memo = {}
+    get_row_indent = table.get_row_indent
+    for r, row in enumerate(table.iter_rows()):
+        out = []
+        for c, txt in enumerate(row):
+            txt_type = type(txt)
+            if txt_type is str and txt == '':
+                out.append('')
+                continue
+            indent = get_row_indent(r, c)
+            if c in col_display:
+                out.append(col_display[c](txt, indent))
+                continue
+            if txt_type is list:
+                key = (list, tuple([(type(x), x) for x in txt]), indent)
+            elif txt_type is uniquebool.UniqueBool or txt is None:
+                key = (txt_type, txt, indent)
+            else:
+                out.append(display(txt, indent))
+                continue
+            try:
+                out.append(memo[key])
+            except KeyError:
+                out.append(memo.setdefault(key, display(txt, indent)))
+            except TypeError:
+                # unhashable
+                out.append(display(txt, indent))
+        yield out
+
+class TsvTable(TableFormatter):
+    """
+    Writes tables as tab (or comma) separated values with the csv module.
+    Rows are written one at a time, straight from the table or columns,
+    with no width pass or padding.
+    """
+    def __init__(self, dialect='excel-tab', indent=' ', header_separator='.'):
+        """
+        dialect -- csv dialect ('excel-tab' for TSV, 'excel' for CSV)
+        indent -- written once per hierarchy level (and indent) before a cell
+        header_separator -- joins hierarchical header names in write_flat
+        """
+        self.dialect = dialect
+        self.indent = indent
+        self.header_separator = header_separator
+
+    def _display(self, td, indent=0):
+        return display_cell(td, indent, self.indent)
+
+    def write(self, table, fp):
+        """
+        Writes the table as laid out for display: header rows (merged cells
+        are written in their first col), then data rows (repeated values
+        are left blank, hierarchy levels are rows of their own).
+        table -- table.Table
+        fp -- file object (opened with newline='' on Python 3)
+        """
+        writer = csv.writer(fp, dialect=self.dialect)
+        display = self._display
+        for row in table.head:
+            writer.writerow(['' if is_blank(txt) else display(txt) for txt in row])
+        
+        for row in iter_display_rows(table, display):
+            writer.writerow(row)
+
+    def write_flat(self, headers, columns, fp):
+        """
+        Writes one header row and one row per data row, with every cell
+        filled in (no blanks for repeated values, no hierarchy level rows).
+        Hierarchical cols are flattened into one col per level
+        (e.g. model.1, model.2).
+        headers -- return value of tags2table.set_headers
+        columns -- normalized Columns
+        fp -- file object (opened with newline='' on Python 3)
+        """
+        header_tree, col_chains, table_cols, num_header_rows = headers
+        writer = csv.writer(fp, dialect=self.dialect)
+        
+        # number of levels of each col (1 unless hierarchical)
+        levels = []
+        for values in columns.values:
+            n_levels = 1
+            for cdata in values:
+                if type(cdata) is list and len(cdata) > n_levels:
+                    n_levels = len(cdata)
+            levels.append(n_levels)
+        
+        head = []
+        for chain, n_levels in zip(col_chains, levels):
+            name = self.header_separator.join([str(x) for x in chain if x is not None])
+            if n_levels == 1:
+                head.append(name)
+            else:
+                head.extend([name + self.header_separator + str(level + 1) for level in range(n_levels)])
+        writer.writerow(head)
+        
+        display = display_value
+        for cells in zip(*columns.values):
+            row = []
+            for cdata, n_levels in zip(cells, levels):
+                if type(cdata) is list and cdata:
+                    # padding (None) levels are left blank
+                    row.extend(['' if x is None else display(x) for x in cdata])
+                    row.extend([''] * (n_levels - len(cdata)))
+                else:
+                    if type(cdata) is list:
+                        # empty list, will be represented as '-'
+                        cdata = None
+                    row.append(display(cdata))
+                    row.extend([''] * (n_levels - 1))
+            writer.writerow(row)
+
+_latex_special = {
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+    '\\': r'\textbackslash{}',
+}
+_latex_special_re = re.compile('|'.join([re.escape(ch) for ch in _latex_special]))
+
+def latex_escape(s):
+    """
+    returns -- s with LaTeX special characters escaped
+    """
+    return _latex_special_re.sub(lambda m: _latex_special[m.group()], s)
+
+class LatexTable(TableFormatter):
+    """
+    Writes tables as LaTeX longtables, one row at a time.
+    Large tables can be split into chunks (separate longtables, optionally in
+    separate files), as LaTeX compile time grows quickly with table length.
+    Chunks only end at top level partition boundaries, so a partition is
+    never split across chunks.
+    """
+    def __init__(self, chunk_rows=None, cite_cols=(), indent=r'\quad '):
+        """
+        chunk_rows -- rows per chunk, a chunk ends at the first top level
+                      partition after this many rows (default: one chunk)
+        cite_cols -- cols of citation keys (written as \\cite{key})
+        indent -- written once per hierarchy level (and indent) before a cell
+        """
+        self.chunk_rows = chunk_rows
+        self.cite_cols = list(cite_cols)
+        self.indent = indent
+
+    def _display(self, td, indent=0):
+        return display_cell(td, indent, self.indent, latex_escape)
+
+    def _cite(self, td, indent=0):
+        if isinstance(td, (list, type(None), uniquebool.UniqueBool)):
+            return self._display(td, indent)
+        # keys are not escaped
+        return r'\cite{' + display_value(td) + '}'
+
+    def iter_head(self, table):
+        """
+        table -- table.Table
+        returns -- generator of lines, from \\begin{longtable} to \\endhead
+        """
+        n_cols = table.n_cols
+        yield r'\begin{longtable}{' + 'l' * n_cols + '}'
+        yield r'\hline'
+        for hr in range(table.n_header_rows):
+            cells = []
+            rules = []
+            c = 0
+            while c < n_cols:
+                stretch = table.get_header_stretch(hr, c)
+                txt = table.get_header_cell(hr, c)
+                contents = '' if is_blank(txt) else self._display(txt)
+                if stretch > 1:
+                    contents = r'\multicolumn{' + str(stretch) + '}{l}{' + contents + '}'
+                cells.append(contents)
+                # any non-leaf header should be underlined, even if it only stretches over one cell
+                if hr < table.n_header_rows - 1 and contents != '':
+                    rules.append(r'\cline{' + str(c + 1) + '-' + str(c + stretch) + '}')
+                c += stretch
+            yield ' & '.join(cells) + r' \\' + ''.join(rules)
+        yield r'\hline'
+        yield r'\endhead'
+        yield r'\hline'
+        yield r'\endfoot'
+
+    def iter_chunks(self, table):
+        """
+        table -- table.Table (with partition_rows set, if chunk_rows is)
+        returns -- generator of chunks, each a generator of lines (a longtable).
+                   Each chunk must be used up before asking for the next.
+        """
+        if not self.chunk_rows:
+            partition_rows = [table.n_data_rows]
+        elif table.partition_rows is None:
+            raise ValueError('table has no partition_rows to split chunks at (see tags2table)')
+        else:
+            partition_rows = table.partition_rows
+        col_display = dict((c, self._cite) for c in self.cite_cols)
+        rows = iter_display_rows(table, self._display, col_display)
+        partitions = iter(partition_rows)
+        pending = [] # rows of the first partition of the next chunk
+        
+        def iter_chunk():
+            for line in self.iter_head(table):
+                yield line
+            n_rows = 0
+            while True:
+                if pending:
+                    height = pending.pop()
+                else:
+                    height = next(partitions, None)
+                    if height is None:
+                        break
+                    if self.chunk_rows and n_rows >= self.chunk_rows:
+                        # start the next chunk with this partition
+                        pending.append(height)
+                        break
+                # every row of the partition, so it is never split
+                for row in itertools.islice(rows, height):
+                    yield ' & '.join(row) + r' \\'
+                n_rows += height
+            yield r'\end{longtable}'
+        
+        yield iter_chunk()
+        while pending:
+            yield iter_chunk()
+
+    def write(self, table, fp):
+        """
+        Writes every chunk to one file
+        table -- table.Table
+        fp -- file object opened for writing text
+        """
+        for chunk in self.iter_chunks(table):
+            for line in chunk:
+                fp.write(line + '\n')
+
+    def write_files(self, table, path_format):
+        """
+        Writes each chunk to its own file
+        table -- table.Table
+        path_format -- chunk file name, with {0} for the chunk number (from 1)
+        returns -- list of files written
+        """
+        paths = []
+        for i, chunk in enumerate(self.iter_chunks(table)):
+            path = path_format.format(i + 1)
+            with open(path, 'w') as fp:
+                for line in chunk:
+                    fp.write(line + '\n')
+            paths.append(path)
+        return paths
@@ -1,6 +1,11 @@
-import copy
+import gc
+import heapq
+import collections
+import numbers
+import contextlib
 from . import table as t
 from . import uniquebool
+from . import trace
 
 def indent(s, amount=2):
     """
@@ -13,16 +18,80 @@ def indent(s, amount=2):
     return "\n".join(results)
 
 class Node(object):
+    # Trees can have roughly rows x cols nodes,
+    # so use slots to avoid the overhead of a __dict__ per node.
+    __slots__ = ('name', 'children', 'descendants', 'depth', 'parent')
+    
     def __init__(self, name):
         self.name = name
-        self.children = []
+        self.children = () # leaf nodes share an empty tuple,
+                           # a list is only allocated when a child is added
         self.descendants = 1 # count leaf nodes as 1
         self.depth = 1
         self.parent = None
     
     def add_child(self, child):
-        self.children.append(child)
+        """
+        Adds child, and updates descendant counts and depths
+        of this node and its ancestors.
+        """
+        if self.children:
+            self.children.append(child)
+            # a new leaf (or subtree) to the side of existing ones
+            added = child.descendants
+        else:
+            self.children = [child]
+            # this node no longer counts as a leaf itself
+            added = child.descendants - 1
         child.parent = self
+        
+        depth = child.depth + 1
+        node = self
+        while node is not None and (added or depth > node.depth):
+            node.descendants += added
+            if depth > node.depth:
+                node.depth = depth
+            depth = node.depth + 1
+            node = node.parent
+    
+    def insert_children(self, index, children):
+        """
+        Inserts children before index, and updates descendant counts and depths
+        of this node and its ancestors.
+        """
+        if not children:
+            return
+        self.children = list(self.children)
+        self.children[index:index] = children
+        for child in children:
+            child.parent = self
+        self._refresh_counts()
+    
+    def remove_children(self, start, end):
+        """
+        Removes children [start, end), and updates descendant counts and depths
+        of this node and its ancestors.
+        return -- list of removed children
+        """
+        removed = self.children[start:end]
+        if not removed:
+            return []
+        del self.children[start:end]
+        for child in removed:
+            child.parent = None
+        self._refresh_counts()
+        return removed
+    
+    def _refresh_counts(self):
+        # back up the tree from this node
+        node = self
+        while node is not None:
+            if node.children:
+                node.update_descendants()
+            else:
+                node.descendants = 1
+                node.depth = 1
+            node = node.parent
     
     @property
     def child_count(self):
@@ -35,7 +104,10 @@ class Node(object):
         self.depth = 1 + max([c.depth for c in self.children]) # max depth
     
     def recalc_descendants(self):
-        """Recursively updates descendant counts (assumes acylic graph)"""
+        """
+        Recursively updates descendant counts (assumes acylic graph).
+        Not normally needed, add_child keeps counts up to date.
+        """
         # back up tree (in reverse order - from leaves up)
         branches = []
         sweep = [self]
@@ -44,7 +116,7 @@ class Node(object):
             for node in sweep:
                 if len(node.children) > 0:
                     branches.append(node)
-                    sweep_next += node.children
+                    sweep_next.extend(node.children)
             sweep = sweep_next
         
         for node in reversed(branches):
@@ -71,10 +143,10 @@ class Node(object):
         # same target length.
         if length == 1:
             # When target length reaches 0, then we shouldn't have any children
-            assert self.children == []
+            assert not self.children
             return
             
-        if self.children == []:
+        if not self.children:
             # If no children, extend
             self.add_child(Node(None))
 
@@ -88,9 +160,11 @@ class Node(object):
         return '\n'.join(result)
 
 class HeaderNode(Node):
-    pass
+    __slots__ = ()
     
 class DataNode(Node):
+    __slots__ = ('row_start', 'height')
+    
     def __init__(self, *args, **kwargs):
         super(DataNode, self).__init__(*args, **kwargs)
         self.row_start = None
@@ -132,8 +206,6 @@ def create_header_tree(cols):
 
         current_sweep = next_sweep
     
-    root.recalc_descendants() # todo, make Node class automatically update counts.
-    
     # root with all elements connected, and descendants counted
     return root
 
@@ -201,18 +273,219 @@ def fill_headers(tree, table):
     # leaves are col names
     return leaves
 
-def create_data_tree(cols, data):
+# below this many rows, starting worker processes costs more than it saves
+PARALLEL_MIN_ROWS = 50000
+
+def create_data_tree(columns, workers=1, min_rows=PARALLEL_MIN_ROWS):
     """
-    cols -- col_chains returned by set_headers
-    data -- tags data
+    columns -- normalized Columns
+    workers -- number of processes to build the tree with
+    min_rows -- fewest rows to use workers for (smaller tables are built serially)
     """
     root = DataNode('Root')
     root.row_start = 0
-    root.height = len(data) # root partition contains all data rows
-                            # this will later be sub-partitioned
+    root.height = columns.n_rows # root partition contains all data rows
+                                 # this will later be sub-partitioned
+    if workers > 1 and columns.n_rows >= min_rows and len(columns.values) > 1:
+        partition_columns_parallel(columns, root, workers)
+    else:
+        partition_columns(columns, [root], 0)
+    
+    # root node with all partitions attached
+    return root
+
+@contextlib.contextmanager
+def gc_paused():
+    """
+    Pauses the cyclic garbage collector, while a pool worker builds subtrees.
+    Every node added counts towards the next collection, and each
+    collection has to look at every node built so far, so with the
+    collector on, building a large tree takes about twice as long.
+    Only used in worker processes, which do nothing else, so the
+    caller's own process never has its collector turned off.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def flatten_tree(nodes):
+    """
+    nodes -- partitions (DataNodes) built by partition_columns
+    return -- nodes and all their descendants, in post order, as a tuple of lists
+              (levels below nodes, row_starts, heights, child counts, descendants, depths)
+              and a dict of index -> name of hierarchy header nodes.
+              Lists of ints are much faster to pickle than Nodes, and the
+              other names are looked up in Columns by unflatten_tree.
+    """
+    order = []
+    levels = []
+    sweep = [(node, 0) for node in nodes]
+    while sweep:
+        node, level = sweep.pop()
+        order.append(node)
+        levels.append(level)
+        sweep.extend([(child, level + 1) for child in node.children])
+    # (node, then its children right to left) reversed is post order
+    order.reverse()
+    levels.reverse()
+    header_names = {}
+    for i, node in enumerate(order):
+        if node.height == 0:
+            # hierarchy header (not a cell of the row it starts at)
+            header_names[i] = node.name
+    flat = (
+        levels,
+        [node.row_start for node in order],
+        [node.height for node in order],
+        [len(node.children) for node in order],
+        [node.descendants for node in order],
+        [node.depth for node in order],
+    )
+    return flat, header_names
+
+def unflatten_tree(columns, c_start, flat, header_names):
+    """
+    columns -- normalized Columns the tree was built from
+    c_start -- col the children of the flattened nodes were partitioned by
+    flat, header_names -- return value of flatten_tree
+    return -- copies of the nodes passed to flatten_tree (with parent and name None)
+    """
+    new = DataNode.__new__
+    values = columns.values[c_start - 1:]
+    built = [] # subtrees not yet attached to a parent
+    for i, (level, row_start, height, count, descendants, depth) in enumerate(zip(*flat)):
+        node = new(DataNode)
+        if level == 0:
+            node.name = None
+        elif height:
+            # partitions are named after the value of their first row
+            node.name = values[level][row_start]
+        else:
+            node.name = header_names[i]
+        node.row_start = row_start
+        node.height = height
+        node.descendants = descendants
+        node.depth = depth
+        node.parent = None
+        if count:
+            # children are the last subtrees built
+            children = built[-count:]
+            del built[-count:]
+            for child in children:
+                child.parent = node
+            node.children = children
+        else:
+            node.children = ()
+        built.append(node)
+    return built
+
+_worker_columns = None # Columns shared with each worker process
+
+def _set_worker_columns(columns):
+    global _worker_columns
+    _worker_columns = columns
+
+def partition_subtrees(partitions, c_start):
+    """
+    Builds the subtrees of some partitions (in a worker process)
+    partitions -- list of (row_start, height) of each partition
+    c_start -- col to partition by first
+    return -- flatten_tree of the partitions
+    """
+    nodes = []
+    for row_start, height in partitions:
+        node = DataNode(None)
+        node.row_start = row_start
+        node.height = height
+        nodes.append(node)
+    with gc_paused():
+        partition_columns(_worker_columns, nodes, c_start)
+        return flatten_tree(nodes)
+
+def partition_columns_parallel(columns, root, workers, batches_per_worker=4):
+    """
+    Same as partition_columns(columns, [root], 0), but once the first col
+    has split the rows into partitions (which are independent of each other),
+    they are sub-partitioned in a pool of processes.
+    If the first col has too few distinct values to keep the workers busy,
+    the next col is partitioned first too, and so on.
+    columns -- normalized Columns
+    root -- DataNode of all rows
+    workers -- number of worker processes
+    batches_per_worker -- partitions are sent in about this many
+                          batches (of similar numbers of rows) per worker
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    n_batches = workers * batches_per_worker
+    n_cols = len(columns.values)
     sweep = [root]
+    levels = [] # sweeps partitioned here, above the ones sent to workers
+    c = 0
+    while c < n_cols - 1 and (c == 0 or len(sweep) < workers):
+        levels.append(sweep)
+        next_sweep = []
+        values = columns.values[c]
+        for partition in sweep:
+            rstart = partition.row_start
+            partition_rows(partition, values, rstart, rstart + partition.height, False, next_sweep)
+        sweep = next_sweep
+        c += 1
+    
+    batch_rows = max(1, columns.n_rows // n_batches)
+    batches = [] # lists of partitions
+    batch = []
+    rows = 0
+    for node in sweep:
+        batch.append(node)
+        rows += node.height
+        if rows >= batch_rows:
+            batches.append(batch)
+            batch = []
+            rows = 0
+    if batch:
+        batches.append(batch)
     
-    for c, col_name in enumerate(cols):
+    # Columns are sent to each worker once as it starts
+    # (and not copied at all where workers are forked).
+    with ProcessPoolExecutor(workers, initializer=_set_worker_columns, initargs=(columns,)) as executor:
+        futures = []
+        for batch in batches:
+            partitions = [(node.row_start, node.height) for node in batch]
+            futures.append(executor.submit(partition_subtrees, partitions, c))
+        
+        for batch, future in zip(batches, futures):
+            flat, header_names = future.result()
+            for node, built in zip(batch, unflatten_tree(columns, c, flat, header_names)):
+                # graft the subtree
+                node.children = built.children
+                node.descendants = built.descendants
+                node.depth = built.depth
+                for child in node.children:
+                    child.parent = node
+    
+    # counts of the partitions above the grafted ones, from the bottom up
+    for sweep in reversed(levels):
+        for node in sweep:
+            if node.children:
+                node.update_descendants()
+
+def partition_columns(columns, sweep, c_start):
+    """
+    Sub-partitions each partition in sweep by col c_start, then each of those
+    by the next col, and so on to the last col.
+    columns -- normalized Columns
+    sweep -- DataNodes partitioned by the cols before c_start
+    c_start -- first col to partition by
+    """
+    n_cols = len(columns.values)
+    
+    for c in range(c_start, n_cols):
+        values = columns.values[c]
         # Split up data into horizontal partitions.
         # Consecutive rows with the same col value will be placed in the same partition
         next_sweep = []
@@ -220,82 +493,106 @@ def create_data_tree(cols, data):
         for partition in sweep:
             rstart = partition.row_start
             rend   = rstart + partition.height
+            partition_rows(partition, values, rstart, rend, c == n_cols-1, next_sweep)
+        
+        sweep = next_sweep
+
+def partition_rows(partition, values, rstart, rend, last_col, next_sweep,
+                   sub_partition=None, hierarchy_context=None):
+    """
+    Splits rows of one col into sub-partitions of consecutive equal values
+    partition -- DataNode to add the sub-partitions to
+    values -- col values
+    rstart, rend -- rows to split (rend excluded)
+    last_col -- whether values is the last col
+    next_sweep -- list that new sub-partitions are appended to
+    sub_partition, hierarchy_context -- state after the rows before rstart
+                                        (to resume partitioning part way through)
+    return -- (sub_partition, hierarchy_context) after rend
+    """
+    if hierarchy_context is None:
+        hierarchy_context = [] # Current hierarchy context.
+                               # Used to decide whether to insert
+                               # special hierarchy partition row
+    
+    for r in range(rstart, rend):
+        cdata = values[r]
+        
+        if type(cdata) is list:
+            # hierarchy
+            diff_index = 0
             
-            sub_partition = None
-            hierarchy_context = [] # Current hierarchy context.
-                                   # Used to decide whether to insert
-                                   # special hierarchy partition row
-            
-            for r in range(rstart, rend):
-                rdata = data[r]
-
-                # lookup cell data for this row, column
-                try:
-                    cdata = fuzzy_row_lookup(rdata, col_name)
-                except KeyError:
-                    cdata = None
-                
-                if type(cdata) is list:
-                    # hierarchy
-                    diff_index = 0
-                    
-                    while diff_index < min(len(cdata)-1, len(hierarchy_context)):
-                        if cdata[diff_index] == hierarchy_context[diff_index]:
-                            diff_index += 1
-                        else:
-                            # diff_index will be the first index where
-                            # desired hierarchy context differs from last
-                            # hierarchy context
-                            break
-                    
-                    for level in cdata[diff_index:-1]:
-                        # insert header for level
-                        # Start a new partition for this row
-                        sub_partition = DataNode(level)
-                        sub_partition.row_start = r
-                        sub_partition.height = 0
-                        partition.add_child(sub_partition)
-                        next_sweep.append(sub_partition)
-                    
-                    hierarchy_context = cdata[:-1]
-                
-                # every row in last column is always its own partition
-                # (prevents creating rows that are completely blank / missing).
-                if sub_partition != None and cdata == sub_partition.val and c != len(cols)-1:
-                    # Repeated value in this column.
-                    # Merge this cell into the last group.
-                    sub_partition.height += 1
+            while diff_index < min(len(cdata)-1, len(hierarchy_context)):
+                if cdata[diff_index] == hierarchy_context[diff_index]:
+                    diff_index += 1
                 else:
-                    # Start a new partition for this row
-                    sub_partition = DataNode(cdata)
-                    sub_partition.row_start = r
-                    partition.add_child(sub_partition)
-                    next_sweep.append(sub_partition)
+                    # diff_index will be the first index where
+                    # desired hierarchy context differs from last
+                    # hierarchy context
+                    break
+            
+            for level in cdata[diff_index:-1]:
+                # insert header for level
+                # Start a new partition for this row
+                sub_partition = DataNode(level)
+                sub_partition.row_start = r
+                sub_partition.height = 0
+                partition.add_child(sub_partition)
+                next_sweep.append(sub_partition)
+            
+            hierarchy_context = cdata[:-1]
         
-        sweep = next_sweep
+        # every row in last column is always its own partition
+        # (prevents creating rows that are completely blank / missing).
+        if sub_partition != None and cdata == sub_partition.val and not last_col:
+            # Repeated value in this column.
+            # Merge this cell into the last group.
+            sub_partition.height += 1
+        else:
+            # Start a new partition for this row
+            sub_partition = DataNode(cdata)
+            sub_partition.row_start = r
+            partition.add_child(sub_partition)
+            next_sweep.append(sub_partition)
     
-    root.recalc_descendants() # todo, make Node class automatically update counts.
+    return sub_partition, hierarchy_context
 
-    # root node with all partitions attached
-    return root
+def truncate_tree(tree, max_rows):
+    """
+    Removes the nodes of every row after the first max_rows rows
+    tree -- row tree (modified in place)
+    max_rows -- number of rows to keep
+    """
+    node = tree
+    while node.children and node.descendants > max_rows:
+        rows = 0
+        for i, child in enumerate(node.children):
+            if rows + child.descendants >= max_rows:
+                break
+            rows += child.descendants
+        # child holds the last kept row
+        node.remove_children(i + 1, len(node.children))
+        max_rows -= rows
+        node = child
 
-def setup_data_cels(col_chains, data):
+def setup_data_cels(columns, workers=1):
     """
-    col_chains -- col_chains leaves returned by set_headers
-    data -- tags data
+    columns -- normalized Columns
+    workers -- see create_data_tree
     retrn -- data_tree, num_rows
     """
-    data_tree = create_data_tree(col_chains, data)
+    data_tree = create_data_tree(columns, workers)
     num_rows = data_tree.descendants
     return data_tree, num_rows
 
-def fill_data_cels(table, row_tree):
+def fill_data_cels(table, row_tree, c_start=0):
     """
     table    -- built table
     row_tree -- return value of setup_data_cels
+    c_start  -- col of the top level partitions of row_tree
     """
     def visit(r, c, node):
-        table.set_row_cell(r, c, node.val)
+        table.set_row_cell(r, c_start + c, node.val)
         
     # walk tree and fill table cells
     walk_tree(
@@ -303,6 +600,45 @@ def fill_data_cels(table, row_tree):
         visit
     )
 
+def top_partition_rows(row_tree):
+    """
+    Table rows of each top level partition of the row tree.
+    The header rows of a hierarchy in the first col and the rows below
+    them are one partition, so a table split between partitions never
+    splits a hierarchy.
+    row_tree -- return value of setup_data_cels
+    return -- list of numbers of rows, in table order
+    """
+    children = row_tree.children
+    if not children:
+        # a single blank row
+        return [row_tree.descendants]
+    
+    # whether a partition starts at each child
+    starts = [True] * len(children)
+    headers = [] # hierarchy header nodes (height 0) before the current child
+    for i, child in enumerate(children):
+        if child.height == 0:
+            headers.append(i)
+            continue
+        cdata = child.val
+        if type(cdata) is list and len(cdata) > 1:
+            # the headers were inserted for the last levels of cdata
+            # (the levels above them are headers of an earlier row)
+            top = len(cdata) - 1 - len(headers)
+            for level, h in enumerate(headers, top):
+                starts[h] = level == 0
+            starts[i] = False
+        headers = []
+    
+    rows = []
+    for start, child in zip(starts, children):
+        if start or not rows:
+            rows.append(child.descendants)
+        else:
+            rows[-1] += child.descendants
+    return rows
+
 def walk_tree(tree, visit_func):
     """
     Depth-first walk of tree of Nodes.
@@ -314,20 +650,19 @@ def walk_tree(tree, visit_func):
     # walk the tree
     r = 0
     c = 0
-    # path depth -> list of children
-    unvisited = [] # list of list of children seen at each node in path.
-                  # TODO: Use doubly linked list for efficiency.
-    unvisited.append(list(tree.children))
+    # path depth -> [children, index of next unvisited child]
+    path = [[tree.children, 0]]
 
     while True:
         #print 'walk {}'.format((r,c))
         
-        unvisited_children = unvisited[-1]
-        if len(unvisited_children) > 0:
+        step = path[-1]
+        children, i = step
+        if i < len(children):
             # dive in
-            node = unvisited_children.pop(0)
-            unseen = list(node.children)
-            unvisited.append(unseen)
+            node = children[i]
+            step[1] = i + 1
+            path.append([node.children, 0])
             
             # visit code here
             visit_func(r, c, node)
@@ -337,14 +672,14 @@ def walk_tree(tree, visit_func):
             c += 1
         else:
             # backtrack
-            while len(unvisited_children) == 0:
-                unvisited.pop()
+            while step[1] == len(step[0]):
+                path.pop()
                 
-                if len(unvisited) == 0:
+                if len(path) == 0:
                     # seen everything
                     return
                 
-                unvisited_children = unvisited[-1]
+                step = path[-1]
                 # track position
                 c -= 1
             
@@ -386,166 +721,447 @@ def fuzzy_row_lookup(rdata, col):
     cdata = rdata[col]
     return cdata
 
-def normalize_table(col_chains, data, types):
+class Missing(object):
     """
-    Normalize data in table to make processing simpler
-    col_chains -- from set_headers
-    data -- table input data array
-    types -- table input type array
-    return -- data_norm, the normalized data array
+    Marks a cell that is not present in its row
+    (as opposed to a cell explicitly set to None)
     """
-    # Currently:
-    # * Normalize hierarchies (ensure consistent level depths)
-    # Todo: fill in missing cells
+    def __repr__(self):
+        return "MISSING"
+    def __deepcopy__(self, _):
+        return self
+    def __copy__(self):
+        return self
+
+MISSING = Missing() # unique object
+
+class Columns(object):
+    """
+    Columnar representation of table data, built once from the row dicts.
+    Holds one resolved key and one value array per col_chain, so later stages
+    can look up cells by index instead of by fuzzy key.
+    Cells not present in a row are set to MISSING.
+    """
+    def __init__(self, col_chains, data):
+        """
+        col_chains -- from set_headers
+        data -- table input data array (not modified)
+        """
+        self.chains = col_chains
+        self.keys = [fuzzy_row_key(None, col_name) for col_name in col_chains]
+        self.n_rows = len(data)
+        # Replace pesky True, False objects with our own uniquebool.TRUE, uniquebool.FALSE
+        # objects. This prevents partitioning issues due to True == 1.
+        # Only cells that contain a bool are copied.
+        replace_bool = uniquebool.replace_bool
+        self.values = []
+        for key in self.keys:
+            self.values.append([replace_bool(rdata.get(key, MISSING)) for rdata in data])
+
+    def reorder(self, order):
+        """
+        Reorders rows in place
+        order -- list of old row index for each new row
+                 (rows not in order are dropped)
+        """
+        for values in self.values:
+            values[:] = [values[r] for r in order]
+        self.n_rows = len(order)
+
+def hierarchy_lengths(hierarchy_headers):
+    """
+    Find ideal header lengths for a hierarchical column.
+    Any main header is padded to be at least the length of its sub headers.
+    e.g., if there is a A.B header, then data for the A header is pushed into A.-
+    hierarchy_headers -- set of headers (tuples) found in column
+    return -- dict of old header (tuple) -> new length
+    """
+    # old header -> new length
+    header_lengths = dict()
     
-    data_norm = copy.deepcopy(data)
+    # find ideal header lengths
+    for header in hierarchy_headers:
+        # pad any main headers above this header
+        # to be at least the length of this header.
+        for i in range(1, len(header)+1):
+            sub_header = header[0:i]
+            header_lengths[sub_header] = max(header_lengths.get(sub_header, 0), len(header))
     
-    # Set missing cells in bool cols to False
-    for c, col_name in enumerate(col_chains):
-        if types[c] == 'bool':
-            for r, rdata in enumerate(data):
-                
-                col_norm = fuzzy_row_key(rdata, col_name)
-                
-                try:
-                    cdata = rdata[col_norm]
-                except KeyError:
-                    # missing data => convert to False
-                    cdata = uniquebool.FALSE
-                
-                data_norm[r][col_norm] = cdata
+    return header_lengths
+
+def normalize_column(values, col_type=None):
+    """
+    Normalizes a column in a single pass over its cells:
+    * Infers the column type (if not already set)
+    * Sets missing cells in bool cols to False (and in other cols to None)
+    * Collects hierarchy headers, then pads them to consistent level depths
+    values -- column values (normalized in place)
+    col_type -- type of column, or None to infer from data
+    return -- col_type
+    """
+    inferring = col_type == None
+    if inferring:
+        # Default to assuming bool until a non-bool is seen
+        # Empty => 'F'
+        col_type = 'bool'
     
-    # Normalize hierarchies
-    for c, col_name in enumerate(col_chains):
-        hierarchy_headers = set()
-        
-        # find hierarchical cols
-        for r, rdata in enumerate(data):
-            
-            try:
-                cdata = fuzzy_row_lookup(rdata, col_name)
-            except KeyError:
-                cdata = None
-            
-            if type(cdata) is list:
-                key = tuple(cdata)
-                hierarchy_headers.add(key)
+    if col_type == 'bool':
+        # missing data => convert to False
+        fill = uniquebool.FALSE
+    else:
+        fill = None
+    
+    filled = [] # rows filled with False while still assuming bool
+    hierarchy_headers = set()
+    hierarchy_rows = []
+    
+    for r, cdata in enumerate(values):
+        if cdata is MISSING:
+            values[r] = fill
+            if inferring:
+                filled.append(r)
+            continue
         
-        # old header -> new length
-        header_lengths = dict()
+        if type(cdata) is list:
+            hierarchy_rows.append(r)
+            hierarchy_headers.add(tuple(cdata))
         
-        # find ideal header lengths
-        for header in hierarchy_headers:
-            # pad any main headers above this header
-            # to be at least the length of this header.
-            # e.g., if there is a A.B header,
-            # then push any data for the A header into A.-
-            sub_headers = []
-            
-            for i in range(1, len(header)+1):
-                sub_header = header[0:i]
-                sub_headers.append(sub_header)
-            
-            for sub_header in sub_headers:
-                if sub_header not in header_lengths:
-                    header_lengths[sub_header] = 0 # initialize
+        if inferring and cdata is not None and type(cdata) is not uniquebool.UniqueBool:
+            # non-boolean. Assume text.
+            # Empty => '-'
+            # (stop inferring, no need to check the rest of the column)
+            inferring = False
+            col_type = 'str'
+            fill = None
+            for r_filled in filled:
+                values[r_filled] = None
+            filled = None
+    
+    if hierarchy_headers:
+        header_lengths = hierarchy_lengths(hierarchy_headers)
+        for r in hierarchy_rows:
+            cdata = values[r]
+            key = tuple(cdata)
+            if key in header_lengths:
+                pad_len = header_lengths[key]
+                # pad header with Nones to make correct length
+                pad_diff = pad_len - len(cdata)
+                assert pad_diff >= 0
+                if pad_diff > 0:
+                    values[r] = cdata + [None] * pad_diff
+    
+    return col_type
 
-                header_lengths[sub_header] = max(header_lengths[sub_header], len(header))
-        
-        # pad headers
-        for r, rdata in enumerate(data):
-            
-            col_norm = fuzzy_row_key(rdata, col_name)
-            
-            try:
-                cdata = rdata[col_norm]
-            except KeyError:
-                cdata = None
+def normalize_table(columns, types):
+    """
+    Normalize data in table to make processing simpler
+    columns -- Columns (normalized in place)
+    types -- table input type array. Unspecified (None) types are inferred from data.
+    return -- columns
+    """
+    for c, values in enumerate(columns.values):
+        types[c] = normalize_column(values, types[c])
+    
+    return columns
 
-            if type(cdata) is list:
-                key = tuple(cdata)
-                
-                if key in header_lengths:
-                    pad_len = header_lengths[key]
-                    # pad header with Nones to make correct length
-                    pad_diff = pad_len - len(cdata)
-                    assert pad_diff >= 0
-                    cdata_new = cdata + [None] * pad_diff                    
-                    #print ('old {} new {}'.format(cdata, cdata_new))
-                    
-                    # use row_new
-                    data_norm[r][col_norm] = cdata_new
-    
-    return data_norm
-
-def infer_type(col_chains, types, data):    
-    for c, col_name in enumerate(col_chains):
-        if types[c] != None:
-            # already set
+try:
+    # Python 2
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+def sort_key(cdata):
+    """
+    Key for sorting normalized cells within a column.
+    Cells of different types are ranked rather than compared:
+    None < FALSE < TRUE < numbers < text < hierarchies.
+    Hierarchies are compared level by level (so A.- sorts before A.B).
+    cdata -- normalized cell data
+    return -- key
+    """
+    if cdata is None:
+        return (0,)
+    elif cdata is uniquebool.FALSE:
+        return (1,)
+    elif cdata is uniquebool.TRUE:
+        return (2,)
+    elif type(cdata) is list:
+        return (5, tuple([sort_key(level) for level in cdata]))
+    elif isinstance(cdata, numbers.Number):
+        return (3, cdata)
+    elif isinstance(cdata, _string_types):
+        return (4, cdata)
+    else:
+        return (6, str(cdata))
+
+def sort_table(columns, sort_last=(), max_rows=None):
+    """
+    Sorts rows (stable) by every column, left to right.
+    Sorting places equal values in consecutive rows, so they are merged
+    into the same partition by create_data_tree.
+    columns -- normalized Columns (sorted in place)
+    sort_last -- names of top level cols to compare after all others
+                 (e.g. the reference col, so it doesn't override later cols)
+    max_rows -- only keep the first max_rows rows (selected without sorting the rest)
+    return -- columns
+    """
+    if max_rows is not None and max_rows < columns.n_rows:
+        order = first_rows(columns, sort_last, max_rows)
+    else:
+        row_keys = row_sort_keys(columns, sort_last)
+        order = sorted(range(columns.n_rows), key=row_keys.__getitem__)
+    columns.reorder(order)
+    return columns
+
+def first_rows(columns, sort_last, max_rows):
+    """
+    Same as the first max_rows rows of sort_table's order (including the order of ties),
+    without sorting or computing the full sort key of every row.
+    columns -- normalized Columns
+    sort_last -- see sort_table
+    return -- list of row indexes
+    """
+    cols = sort_cols(columns.chains, sort_last)
+    rows = range(columns.n_rows)
+    if cols:
+        # rows that come after max_rows others by the first col alone can't be kept
+        first = [sort_key(cdata) for cdata in columns.values[cols[0]]]
+        cutoff = heapq.nsmallest(max_rows, first)[-1]
+        rows = [r for r in rows if first[r] <= cutoff]
+    values = [columns.values[c] for c in cols]
+    def row_key(r):
+        return tuple([sort_key(col_values[r]) for col_values in values])
+    return heapq.nsmallest(max_rows, rows, key=row_key)
+
+def group_rows(columns, sort_last=()):
+    """
+    Alternative to sort_table, that keeps rows in the order they were first seen.
+    Moves each row up next to the first row with the same values in the cols
+    before it, so equal values are merged into the same partition by
+    create_data_tree (rather than starting a new partition wherever they
+    are not in consecutive rows). Rows are only compared (by hash) with rows
+    in the same partition, one col at a time, so no sorting is needed.
+    Hierarchies are grouped level by level, in the order each level was first seen.
+    columns -- normalized Columns (grouped in place)
+    sort_last -- see sort_table (cols are grouped in the same order as they are sorted)
+    return -- columns
+    """
+    n_cols = len(columns.values)
+    order = list(range(columns.n_rows))
+    partitions = [(0, columns.n_rows)] # [start, end) of rows grouped so far
+    changed = False
+    for c in sort_cols(columns.chains, sort_last):
+        # every row of the last col is its own partition anyway,
+        # but the hierarchy header rows above them still need grouping
+        last_col = c == n_cols - 1
+        values = columns.values[c]
+        if last_col and not any([type(cdata) is list for cdata in values]):
             continue
-        
-        bool_count = 0
-        empty_count = 0
-        other_count = 0
-
-        # find hierarchical cols
-        for r, rdata in enumerate(data):
-            try:
-                cdata = fuzzy_row_lookup(rdata, col_name)
-            except KeyError:
-                cdata = None
-            
-            if cdata == None:
-                empty_count += 1
-            elif type(cdata) is uniquebool.UniqueBool:
-                bool_count += 1
+        next_partitions = []
+        for start, end in partitions:
+            if end - start < 2:
+                next_partitions.append((start, end))
+                continue
+            groups = group_values(values, order[start:end], last_col)
+            if len(groups) == 1:
+                next_partitions.append((start, end))
+                continue
+            r = start
+            for rows in groups:
+                if order[r:r + len(rows)] != rows:
+                    changed = True
+                    order[r:r + len(rows)] = rows
+                next_partitions.append((r, r + len(rows)))
+                r += len(rows)
+        partitions = next_partitions
+    
+    if changed:
+        columns.reorder(order)
+    return columns
+
+def group_values(values, rows, headers_only=False):
+    """
+    values -- normalized col values
+    rows -- row indexes, in order
+    headers_only -- only group hierarchies by their headers (all but the last level),
+                    and leave every other value in a group of its own (for the last col)
+    return -- list of lists of rows with equal values, in the order
+              each value (or hierarchy level) was first seen
+    """
+    groups = collections.OrderedDict() # key -> rows
+    paths = {} # key of hierarchy -> first seen rank of each level
+    ranks = {} # key or hierarchy prefix -> first seen rank
+    for r in rows:
+        cdata = values[r]
+        hierarchy = type(cdata) is list
+        if headers_only:
+            if hierarchy and len(cdata) > 1:
+                cdata = cdata[:-1]
             else:
-                other_count += 1
+                hierarchy = False
+                cdata = (MISSING, r)
+        key = (list, tuple(cdata)) if hierarchy else cdata
+        try:
+            group = groups.get(key)
+        except TypeError:
+            # unhashable, never merged with other rows
+            hierarchy = False
+            key = (MISSING, r)
+            group = None
+        if group is not None:
+            group.append(r)
+            continue
         
-        if other_count > 0:
-            # non-boolean. Assume text.
-            # Empty => '-'
-            types[c] = 'str'
-        else:            
-            # Default to assuming bool
-            # Empty => 'F'
-            types[c] = 'bool'
+        groups[key] = [r]
+        if hierarchy:
+            # (an empty hierarchy gets a rank of its own too)
+            paths[key] = [ranks.setdefault((list, key[1][:i]), len(ranks))
+                          for i in range(1, max(1, len(cdata)) + 1)]
+        else:
+            ranks[key] = len(ranks)
+    
+    if not paths:
+        # first seen order
+        return list(groups.values())
+    # hierarchies that share a level are kept together, e.g. A.B, C, A.D => A.B, A.D, C
+    def group_key(key):
+        if key in paths:
+            return paths[key]
+        return [ranks[key]]
+    return [groups[key] for key in sorted(groups, key=group_key)]
+
+def sort_cols(col_chains, sort_last=()):
+    """
+    col_chains -- from set_headers
+    sort_last -- see sort_table
+    return -- col indexes, in the order rows are compared by
+    """
+    first = []
+    last = []
+    for c, chain in enumerate(col_chains):
+        if chain[0] in sort_last:
+            last.append(c)
+        else:
+            first.append(c)
+    return first + last
 
-    return types
+def row_sort_keys(columns, sort_last=()):
+    """
+    columns -- normalized Columns
+    sort_last -- see sort_table
+    return -- list of one sort key per row
+    """
+    col_keys = [[sort_key(cdata) for cdata in columns.values[c]]
+                for c in sort_cols(columns.chains, sort_last)]
+    return list(zip(*col_keys))
 
-def tags2table(table_arg):
+def count_nodes(tree):
     """
-    See examples for how to specify table_arg
+    return -- number of nodes in tree (not including the root)
+    """
+    count = 0
+    sweep = [tree]
+    while sweep:
+        sweep_next = []
+        for node in sweep:
+            count += len(node.children)
+            sweep_next.extend(node.children)
+        sweep = sweep_next
+    return count
+
+def tags2columns(table_arg, tracer=None, max_rows=None):
+    """
+    Runs the stages of tags2table up to building the row tree
     table_arg -- dict of data and cols
-    return -- Table
+    tracer -- optional trace.Tracer to receive per stage timings
+    max_rows -- only keep the first max_rows rows (after sorting)
+    return -- (return value of set_headers,
+               normalized Columns, sorted if table_arg['sort_rows'],
+               else grouped if table_arg['group_rows'])
     """
-    table = t.Table()
     data = table_arg['data']
     cols = table_arg['cols']
     
-    # Replace pesky True, False objects with our own uniquebool.TRUE, uniquebool.FALSE
-    # objects. This prevents partitioning issues due to True == 1.
-    data = uniquebool.deep_replace_bool(data)
-
-    header_tree, col_chains, table_cols, num_header_rows = set_headers(cols, data, table)
+    span = trace.start(tracer, 'set_headers')
+    headers = set_headers(cols, data, None)
+    header_tree, col_chains, table_cols, num_header_rows = headers
+    trace.end(span, cols=table_cols, header_rows=num_header_rows)
 
     if not 'types' in table_arg:
         table_arg['types'] = [None] * table_cols
     
     types = table_arg['types']
     assert len(types) == table_cols
-    # Attempt to infer unspecified types from data
-    types = infer_type(col_chains, types, data)
+    # Build columns once, all later stages work on them.
+    # table_arg['data'] is never modified.
+    span = trace.start(tracer, 'columns')
+    columns = Columns(col_chains, data)
+    trace.end(span, rows=columns.n_rows, cols=table_cols)
+    
+    # Attempt to infer unspecified types from data, and normalize
+    # (every row, as types and hierarchy padding depend on the whole col)
+    span = trace.start(tracer, 'normalize_table')
+    columns = normalize_table(columns, types)
+    trace.end(span, rows=columns.n_rows)
     
-    data = normalize_table(col_chains, data, types)
-    row_tree, num_rows = setup_data_cels(col_chains, data)
+    if table_arg.get('sort_rows'):
+        span = trace.start(tracer, 'sort_table')
+        columns = sort_table(columns, table_arg.get('sort_last', ()), max_rows)
+        trace.end(span, rows=columns.n_rows)
+    else:
+        if table_arg.get('group_rows'):
+            span = trace.start(tracer, 'group_rows')
+            columns = group_rows(columns, table_arg.get('sort_last', ()))
+            trace.end(span, rows=columns.n_rows)
+        if max_rows is not None and max_rows < columns.n_rows:
+            columns.reorder(range(max_rows))
+    
+    return headers, columns
+
+def tags2table(table_arg, table=None, tracer=None, max_rows=None, workers=1):
+    """
+    See examples for how to specify table_arg
+    table_arg -- dict of data and cols
+    table -- unbuilt Table to fill (default: new table.Table).
+             Pass a table.SparseTable to only store non-blank cells.
+    tracer -- optional trace.Tracer to receive per stage timings
+    max_rows -- only build the first max_rows (at least 1) rows of the table.
+                These are the same as the first rows of the full table.
+    workers -- number of processes to build the row tree with (see create_data_tree)
+    return -- Table
+    """
+    if max_rows is not None and max_rows < 1:
+        raise ValueError('max_rows must be at least 1, got %r' % (max_rows,))
+    if table is None:
+        table = t.Table()
+    
+    # Every data row becomes at least one table row,
+    # so the first max_rows table rows come from the first max_rows data rows.
+    headers, columns = tags2columns(table_arg, tracer, max_rows)
+    header_tree, col_chains, table_cols, num_header_rows = headers
+    
+    span = trace.start(tracer, 'create_data_tree')
+    row_tree, num_rows = setup_data_cels(columns, workers)
+    if max_rows is not None and num_rows > max_rows:
+        # (hierarchy header rows can push the last data rows past max_rows)
+        truncate_tree(row_tree, max_rows)
+        num_rows = row_tree.descendants
+    trace.end(span, rows=num_rows, nodes=lambda: count_nodes(row_tree))
 
+    span = trace.start(tracer, 'build_table')
     table.set_cols(len(col_chains))
     table.set_header_rows(num_header_rows)
     table.set_data_rows(num_rows)
     table.build()
+    trace.end(span, rows=num_rows, cols=table_cols)
 
+    span = trace.start(tracer, 'fill_headers')
     fill_headers(header_tree, table)
+    trace.end(span, header_rows=num_header_rows)
+    
+    span = trace.start(tracer, 'fill_data_cels')
     fill_data_cels(table, row_tree)
+    table.partition_rows = top_partition_rows(row_tree)
+    trace.end(span, rows=num_rows)
 
     return table
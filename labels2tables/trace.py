@@ -0,0 +1,142 @@
+import sys
+import time
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+class Tracer(object):
+    """
+    Receives an event at the start and end of each stage of a build.
+    Pass one as the tracer argument of tags2table, bib2labels or labels2txt.
+    This base class ignores all events, override the ones needed.
+    """
+    def stage_start(self, stage):
+        """
+        stage -- name of stage (e.g. 'create_data_tree')
+        """
+        pass
+
+    def stage_end(self, stage, elapsed, counts, peak):
+        """
+        stage   -- name of stage
+        elapsed -- wall time in seconds
+        counts  -- dict of sizes of what the stage built (e.g. rows, nodes)
+        peak    -- peak traced memory in bytes during the stage
+                   (None unless tracemalloc is tracing)
+        """
+        pass
+
+class _Span(object):
+    __slots__ = ('tracer', 'stage', 'start')
+
+def start(tracer, stage):
+    """
+    tracer  -- Tracer, or None if tracing is disabled
+    stage   -- name of stage
+    returns -- span to pass to end (None if disabled)
+    """
+    if tracer is None:
+        return None
+    tracer.stage_start(stage)
+    if tracemalloc is not None and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+        # (before Python 3.9 the peak is since tracing started)
+        tracemalloc.reset_peak()
+    span = _Span()
+    span.tracer = tracer
+    span.stage = stage
+    span.start = clock()
+    return span
+
+def end(span, **counts):
+    """
+    span   -- return value of start
+    counts -- sizes of what the stage built. Callables are only called when
+              tracing (and after the stage is timed), for counts that take work.
+    """
+    if span is None:
+        return
+    elapsed = clock() - span.start
+    peak = None
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        peak = tracemalloc.get_traced_memory()[1]
+    for name, count in counts.items():
+        if callable(count):
+            counts[name] = count()
+    span.tracer.stage_end(span.stage, elapsed, counts, peak)
+
+class StageReport(Tracer):
+    """
+    Collects stage events, and reports a breakdown of where the time went.
+    """
+    def __init__(self, memory=False):
+        """
+        memory -- also trace memory (starts tracemalloc, which slows down the build)
+        """
+        self.events = [] # (stage, elapsed, counts, peak)
+        self._started_tracing = False
+        if memory and tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stage_end(self, stage, elapsed, counts, peak):
+        self.events.append((stage, elapsed, counts, peak))
+
+    def stop(self):
+        """
+        Stops tracing memory (if started by this report)
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def summary(self):
+        """
+        returns -- list of [stage, calls, total elapsed, last counts, max peak],
+                   one per stage in the order first seen
+        """
+        stages = {}
+        result = []
+        for stage, elapsed, counts, peak in self.events:
+            if stage not in stages:
+                stages[stage] = [stage, 0, 0.0, {}, None]
+                result.append(stages[stage])
+            entry = stages[stage]
+            entry[1] += 1
+            entry[2] += elapsed
+            entry[3] = counts
+            if peak is not None:
+                entry[4] = max(peak, entry[4] or 0)
+        return result
+
+    def format(self):
+        """
+        returns -- breakdown as text
+        """
+        summary = self.summary()
+        total = sum([entry[2] for entry in summary])
+        width = max([len(entry[0]) for entry in summary] + [len('total')])
+        lines = []
+        for stage, calls, elapsed, counts, peak in summary:
+            line = '{0} {1:9.4f} s {2:5.1f}%'.format(
+                stage.ljust(width), elapsed, 100.0 * elapsed / total if total else 0.0)
+            if peak is not None:
+                line += ' {0:8.1f} MiB'.format(peak / 1024.0 / 1024.0)
+            if calls > 1:
+                line += ' x{0}'.format(calls)
+            if counts:
+                line += '  ' + ' '.join(['{0}={1}'.format(k, counts[k]) for k in sorted(counts)])
+            lines.append(line)
+        lines.append('{0} {1:9.4f} s'.format('total'.ljust(width), total))
+        return '\n'.join(lines)
+
+    def print_report(self, fp=None):
+        """
+        fp -- file to print to (default: stderr)
+        """
+        if fp is None:
+            fp = sys.stderr
+        fp.write(self.format() + '\n')
@@ -1,5 +1,9 @@
 import copy
-import collections
+try:
+    import collections.abc as collections_abc
+except ImportError:
+    # Python 2
+    import collections as collections_abc
 from enum import Enum
 
 # Python's built in bools, True and False, are equal to 1 and 0.
@@ -21,6 +25,9 @@ class UniqueBool(object):
         # For equity to work as expected, we want to keep the same instance
         # http://stackoverflow.com/questions/9887501/deepcopy-does-not-respect-metaclass
         return self
+    def __reduce__(self):
+        # Unpickle as the module's instance (e.g. cells sent to another process)
+        return self._name
 
 TRUE = UniqueBool("TRUE") # unique object
 FALSE = UniqueBool("FALSE") # unique object
@@ -45,16 +52,65 @@ def deep_replace_bool(obj):
     deep_replace(cpy, rep)
     return cpy
 
+_SCALAR_TYPES = set([str, int, float, type(None), UniqueBool])
+try:
+    # Python 2
+    _SCALAR_TYPES.update([unicode, long])
+except NameError:
+    pass
+
+def replace_bool(obj):
+    """
+    Copy-on-write alternative to deep_replace_bool.
+    obj -- list, tuple or item that contains ordinary Python bools.
+           Assumed to be acyclic. obj is never modified.
+    return -- obj with Python bools replaced by TRUE and FALSE objects.
+              Only collections that contain a bool are copied,
+              anything else is returned as is (not a copy).
+    """
+    if obj is True:
+        return TRUE
+    elif obj is False:
+        return FALSE
+    
+    # check exact types first, abstract base class checks are slow
+    obj_type = type(obj)
+    if obj_type in _SCALAR_TYPES:
+        return obj
+    elif obj_type is list or obj_type is tuple:
+        is_sequence = True
+    elif obj_type is dict:
+        is_sequence = False
+    elif isinstance(obj, collections_abc.Mapping):
+        is_sequence = False
+    elif isinstance(obj, collections_abc.MutableSequence):
+        is_sequence = True
+    else:
+        return obj
+    
+    if is_sequence:
+        items = [replace_bool(v) for v in obj]
+        if all(a is b for a, b in zip(items, obj)):
+            return obj
+        if obj_type is tuple:
+            return tuple(items)
+        return items
+    else:
+        items = [(k, replace_bool(v)) for k, v in obj.items()]
+        if all(v is obj[k] for k, v in items):
+            return obj
+        return dict(items)
+
 def deep_replace(obj, replace_func):
     """
     obj -- list, tuple or item. Assumed to be acyclic.
     replace_func -- function(item) to return replacement items
     """
-    if isinstance(obj, collections.Mapping):
+    if isinstance(obj, collections_abc.Mapping):
         for k,v in obj.items():
             obj[k] = deep_replace(v, replace_func)
         return obj
-    elif isinstance(obj, collections.MutableSequence):
+    elif isinstance(obj, collections_abc.MutableSequence):
         for k,v in enumerate(obj):
             obj[k] = deep_replace(v, replace_func)
         return obj
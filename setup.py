@@ -23,6 +23,11 @@ setup(
         'Programming Language :: Python :: 3',
     ],
     packages=['labels2tables'],
+    entry_points={
+        'console_scripts': [
+            'labels2tables = labels2tables.cli:main',
+        ],
+    },
     install_requires=[
         'bibtexparser',
         'enum34'
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import labels2tables.core as core
+from tests.test_core import SAMPLE_BIB
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+    import labels2tables.aio as aio
+
+@unittest.skipIf(sys.version_info < (3, 5), 'needs asyncio')
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        self.example_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bib_file = os.path.join(self.tmp_dir, 'sample.bib')
+        with open(self.bib_file, 'w') as f:
+            f.write(SAMPLE_BIB)
+        self.loop = asyncio.new_event_loop()
+    
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_matches_sync(self):
+        for bib_file in [self.bib_file, os.path.join(self.example_dir, 'sport.in.bib')]:
+            for fields in [['ID'], ['ID', 'year']]:
+                labels = self.loop.run_until_complete(aio.bib2labels_async(bib_file, fields=fields))
+                self.assertEqual(labels, core.bib2labels(bib_file, fields=fields))
+        
+        output = os.path.join(self.tmp_dir, 'async.txt')
+        self.loop.run_until_complete(aio.labels2txt_async(labels, output))
+        core.labels2txt(labels, os.path.join(self.tmp_dir, 'sync.txt'))
+        with open(output) as f, open(os.path.join(self.tmp_dir, 'sync.txt')) as g:
+            self.assertEqual(f.read(), g.read())
+    
+    def test_batch(self):
+        bib_file = os.path.join(self.example_dir, 'sport.in.bib')
+        outputs = [os.path.join(self.tmp_dir, 'sport{0}.txt'.format(i)) for i in range(5)]
+        with ProcessPoolExecutor(2) as executor:
+            self.loop.run_until_complete(aio.gather_bounded(
+                [aio.bib2txt_async(bib_file, output, executor) for output in outputs], limit=2))
+        with open(os.path.join(self.example_dir, 'sport.out.txt')) as f:
+            expected = f.read()
+        for output in outputs:
+            with open(output) as f:
+                self.assertEqual(f.read(), expected)
+    
+    def test_gather_bounded(self):
+        aws = [asyncio.sleep(0.01 * (i % 3), result=i) for i in range(10)]
+        results = self.loop.run_until_complete(aio.gather_bounded(aws, limit=3))
+        self.assertEqual(results, list(range(10)))
+        
+        running = [0, 0] # now, max
+        class Job(object):
+            # (no async def, so this file still compiles on Python 2)
+            def __await__(self):
+                running[0] += 1
+                running[1] = max(running)
+                for step in asyncio.sleep(0.01).__await__():
+                    yield step
+                running[0] -= 1
+        self.loop.run_until_complete(aio.gather_bounded([Job() for i in range(10)], limit=3))
+        self.assertEqual(running, [0, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import labels2tables.core as core
+import labels2tables.bibcache as bibcache
+
+class TestBibCache(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        example_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bib_file = os.path.join(self.tmp_dir, 'sport.bib')
+        shutil.copy(os.path.join(example_dir, 'sport.in.bib'), self.bib_file)
+        self.cache = bibcache.BibCache(os.path.join(self.tmp_dir, 'cache'))
+        self.parses = 0
+        self.iter_bib_entries = core.iter_bib_entries
+        
+        def counting_iter_bib_entries(*args, **kwargs):
+            self.parses += 1
+            return self.iter_bib_entries(*args, **kwargs)
+        core.iter_bib_entries = counting_iter_bib_entries
+    
+    def tearDown(self):
+        core.iter_bib_entries = self.iter_bib_entries
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_warm_run_skips_parse(self):
+        expected = core.bib2labels(self.bib_file)
+        self.assertEqual(self.parses, 1)
+        cold = core.bib2labels(self.bib_file, cache=self.cache)
+        self.assertEqual(self.parses, 2)
+        warm = core.bib2labels(self.bib_file, cache=self.cache)
+        self.assertEqual(self.parses, 2)
+        self.assertEqual(cold, expected)
+        self.assertEqual(warm, expected)
+    
+    def test_fields_are_cached_separately(self):
+        core.bib2labels(self.bib_file, cache=self.cache)
+        labels = core.bib2labels(self.bib_file, fields=["ID", "year"], cache=self.cache)
+        self.assertEqual(self.parses, 2)
+        self.assertEqual(labels['data'][0]['year'], '2010')
+    
+    def test_changed_file_invalidates(self):
+        core.bib2labels(self.bib_file, cache=self.cache)
+        with open(self.bib_file, 'a') as f:
+            f.write("\n@article{extra_2017,\n\tkeywords = {game:golf},\n\tyear = {2017}\n}\n")
+        labels = core.bib2labels(self.bib_file, cache=self.cache)
+        self.assertEqual(self.parses, 2)
+        self.assertEqual(len(labels['data']), 4)
+    
+    def test_evict_and_clear(self):
+        core.bib2labels(self.bib_file, cache=self.cache)
+        core.bib2labels(self.bib_file, fields=["ID", "year"], cache=self.cache)
+        self.assertEqual(len(os.listdir(self.cache.cache_dir)), 2)
+        self.cache.max_size = self.cache.size() - 1
+        self.cache.evict()
+        self.assertEqual(len(os.listdir(self.cache.cache_dir)), 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+    
+    def test_left_over_tmp_files(self):
+        core.bib2labels(self.bib_file, cache=self.cache)
+        cache_size = self.cache.size()
+        old = os.path.join(self.cache.cache_dir, 'old.tmp')
+        new = os.path.join(self.cache.cache_dir, 'new.tmp')
+        for path in [old, new]:
+            with open(path, 'w') as f:
+                f.write('x' * 100)
+        stale = os.stat(old).st_mtime - bibcache.TMP_GRACE - 1
+        os.utime(old, (stale, stale))
+        # only the one no longer being written counts
+        self.assertEqual(self.cache.size(), cache_size + 100)
+        self.cache.max_size = cache_size
+        self.cache.evict()
+        names = os.listdir(self.cache.cache_dir)
+        self.assertNotIn('old.tmp', names)
+        self.assertIn('new.tmp', names)
+        self.assertEqual(len(names), 2)
+        os.utime(new, (stale, stale))
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.cache.cache_dir), [])
+    
+    def test_concurrent_writers(self):
+        entries = self.cache.entries(self.bib_file, ["ID"])
+        # small enough that every write evicts the other writers' files
+        self.cache.max_size = 1
+        errors = []
+        def build(fields):
+            try:
+                for i in range(30):
+                    self.cache.store(self.bib_file, fields, entries)
+                    self.cache.load(self.bib_file, fields)
+                    self.cache.evict()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=build, args=(fields,))
+                   for fields in [["ID"], ["ID"], ["ID", "year"], ["ID", "year"]]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.entries(self.bib_file, ["ID"]), entries)
+        # no temporary files left behind
+        self.assertEqual([name for name in os.listdir(self.cache.cache_dir) if not name.endswith('.json')], [])
+
+if __name__ == '__main__':
+    unittest.main()
+
+SAMPLE_BIB = u"""@string{ plos = "PLoS ONE" }
+
+@article{first_2010,
+	journal = plos,
+	keywords = {game:soccer, open-access},
+	year = {2010}
+}
+
+@article{second_2011,
+	journal = {Other},
+	keywords = {game:golf},
+	year = {2011}
+}
+
+@article{third_2012,
+	journal = plos,
+	keywords = {game:chess},
+	year = {2012}
+}
+
+"""
+
+class TestIncrementalBibCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bib_file = os.path.join(self.tmp_dir, 'sample.bib')
+        self.write_bib(SAMPLE_BIB)
+        self.cache = bibcache.BibCache(os.path.join(self.tmp_dir, 'cache'), incremental=True)
+        self.fields = ["ID", "journal"]
+        self.parsed = []
+        self.create_parser = core.create_parser
+        
+        def counting_create_parser(*args, **kwargs):
+            parser = self.create_parser(*args, **kwargs)
+            parse = parser.parse
+            def counting_parse(record):
+                self.parsed.append(record.split(',')[0])
+                return parse(record)
+            parser.parse = counting_parse
+            return parser
+        core.create_parser = counting_create_parser
+    
+    def tearDown(self):
+        core.create_parser = self.create_parser
+        shutil.rmtree(self.tmp_dir)
+    
+    def write_bib(self, txt):
+        with open(self.bib_file, 'w') as f:
+            f.write(txt)
+    
+    def check(self):
+        self.parsed = []
+        actual = core.bib2labels(self.bib_file, fields=self.fields, cache=self.cache)
+        parsed = list(self.parsed)
+        expected = core.bib2labels(self.bib_file, fields=self.fields)
+        self.assertEqual(actual, expected)
+        return parsed
+    
+    def test_only_changed_records_parsed(self):
+        self.assertEqual(len(self.check()), 4)
+        # unchanged file
+        self.assertEqual(self.check(), [])
+        # edit one record
+        self.write_bib(SAMPLE_BIB.replace('game:golf', 'game:golf, open-access'))
+        self.assertEqual(self.check(), ['@string{ plos = "PLoS ONE" }\n\n', '@article{second_2011'])
+        # remove and reorder records
+        records = SAMPLE_BIB.strip().split('\n\n')
+        self.write_bib('\n\n'.join([records[0], records[3], records[1]]) + '\n\n')
+        self.assertEqual(len(self.check()), 1) # just the @string
+    
+    def test_changed_records_parsed_in_pool(self):
+        self.cache.entries(self.bib_file, self.fields)
+        self.write_bib(SAMPLE_BIB.replace('game:golf', 'game:golf, open-access').replace('PLoS', 'PLOS'))
+        self.parsed = []
+        actual = self.cache.entries(self.bib_file, self.fields, workers=2)
+        # only the macros are parsed here, the changed records in worker processes
+        self.assertEqual(self.parsed, ['@string{ plos = "PLOS ONE" }\n\n'])
+        expected = [bibcache.extract_entry(e, self.fields) for e in core.iter_bib_entries(self.bib_file)]
+        self.assertEqual(actual, expected)
+        self.assertEqual(self.cache.entries(self.bib_file, self.fields), expected)
+    
+    def test_changed_macro_reparses_later_records(self):
+        self.check()
+        self.write_bib(SAMPLE_BIB.replace('PLoS ONE', 'PLOS ONE'))
+        self.assertEqual(len(self.check()), 4)
@@ -0,0 +1,105 @@
+import unittest
+import os
+import random
+import labels2tables.tags2table as t2t
+import labels2tables.table as t
+from labels2tables.builder import TableBuilder
+import tests.sample_utils as utils
+
+class TestTableBuilder(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        test_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.samples = []
+        for sub_file in sorted(os.listdir(test_dir)):
+            if sub_file.endswith('.spec.txt'):
+                self.samples.append(utils.load_sample(os.path.join(test_dir, sub_file)))
+
+    def assertMatchesRebuild(self, builder, msg):
+        table_arg = {
+            'cols': builder.cols,
+            'data': list(builder.data),
+            'sort_rows': builder.sort_rows,
+            'sort_last': builder.sort_last,
+            'group_rows': builder.group_rows,
+        }
+        table = t2t.tags2table(table_arg, builder.table_class())
+        self.assertEqual(list(builder.table.iter_rows()), list(table.iter_rows()), msg=msg)
+        self.assertEqual(builder.row_tree.descendants, table.n_data_rows, msg=msg)
+        self.assertEqual(builder.table.partition_rows, table.partition_rows, msg=msg)
+        self.assertEqual(builder.present(), t.TxtTable().present(table), msg=msg)
+
+    def run_changes(self, table_arg, pool, rnd, n_changes, msg):
+        builder = TableBuilder(table_arg, rnd.choice([t.Table, t.SparseTable]))
+        self.assertMatchesRebuild(builder, msg)
+        for i in range(n_changes):
+            if builder.data and rnd.random() < 0.45:
+                builder.remove_row(rnd.randrange(len(builder.data)))
+            else:
+                builder.add_row(rnd.choice(pool))
+            self.assertMatchesRebuild(builder, (msg, i))
+
+    def test_samples(self):
+        rnd = random.Random(0)
+        for sample in self.samples:
+            pool = sample.arg['data']
+            for sort_rows in (False, True):
+                for trial in range(5):
+                    table_arg = {
+                        'cols': sample.arg['cols'],
+                        'data': rnd.sample(pool, rnd.randint(0, len(pool))),
+                        'sort_rows': sort_rows,
+                    }
+                    self.run_changes(table_arg, pool, rnd, 15, (sample.fname, sort_rows))
+
+    def test_mixed_hierarchies(self):
+        # hierarchies of different depths, plain values and missing cells in one col
+        rnd = random.Random(1)
+        games = [['soccer'], ['soccer', 'indoor'], ['golf', 'mini'], ['golf'], [], 'golf', None]
+        pool = []
+        for i in range(60):
+            row = {'reference': 'ref%d' % (i % 20), 'year': rnd.choice([2001, 2002, None])}
+            if rnd.random() < 0.8:
+                row['game'] = rnd.choice(games)
+            if rnd.random() < 0.3:
+                row['open'] = rnd.choice([True, False])
+            pool.append(row)
+        for cols in (['game', 'open', 'year', 'reference'], ['year', 'game'], ['game']):
+            for sort_rows, group_rows in ((False, False), (True, False), (False, True)):
+                table_arg = {
+                    'cols': cols,
+                    'data': rnd.sample(pool, 20),
+                    'sort_rows': sort_rows,
+                    'sort_last': ['reference'],
+                    'group_rows': group_rows,
+                }
+                self.run_changes(table_arg, pool, rnd, 60, (cols, sort_rows, group_rows))
+
+    def test_present_renders_changed_rows(self):
+        sample = self.samples[0]
+        builder = TableBuilder(dict(sample.arg, sort_rows=True))
+        rendered = []
+        format_row = builder.presenter.format_row
+        def count_rows(row, col_widths):
+            rendered.append(row)
+            return format_row(row, col_widths)
+        builder.presenter.format_row = count_rows
+        builder.present()
+        self.assertEqual(len(rendered), builder.table.n_data_rows)
+        
+        # a copy of a row already in the table leaves the col widths as they are
+        del rendered[:]
+        builder.add_row(sample.arg['data'][3])
+        self.assertMatchesRebuild(builder, sample.fname)
+        self.assertTrue(0 < len(rendered) < builder.table.n_data_rows / 2, msg=len(rendered))
+        del rendered[:]
+        builder.remove_row(0)
+        self.assertMatchesRebuild(builder, sample.fname)
+        self.assertTrue(len(rendered) < builder.table.n_data_rows / 2, msg=len(rendered))
+
+    def test_remove_returns_row(self):
+        sample = self.samples[0]
+        builder = TableBuilder(sample.arg)
+        row = sample.arg['data'][0]
+        self.assertIs(builder.remove_row(0), row)
+        self.assertEqual(len(builder.data), len(sample.arg['data']) - 1)
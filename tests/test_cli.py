@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import tempfile
+import labels2tables.cli as cli
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        self.test_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_output_file(self):
+        output = os.path.join(self.tmp_dir, 'sport.out.txt')
+        self.assertEqual(cli.main([os.path.join(self.test_dir, 'sport.in.bib'), '-o', output]), 0)
+        with open(output) as f:
+            actual = f.read()
+        with open(os.path.join(self.test_dir, 'sport.out.txt')) as f:
+            expected = f.read()
+        self.assertEqual(actual, expected)
+
+    def test_group(self):
+        output = os.path.join(self.tmp_dir, 'sport.out.txt')
+        self.assertEqual(cli.main([os.path.join(self.test_dir, 'sport.in.bib'), '-o', output, '--group']), 0)
+        with open(output) as f:
+            lines = f.read().splitlines()
+        # soccer is first in the bibtex file
+        self.assertEqual([lines[3].split()[0], lines[6].split()[0]], ['soccer', 'basketball'])
+
+    def test_latex_renamed_cites(self):
+        output = os.path.join(self.tmp_dir, 'sport.tex')
+        bib_file = os.path.join(self.test_dir, 'sport.in.bib')
+        self.assertEqual(cli.main([bib_file, '-o', output, '--format', 'latex', '--rename', 'ID=key']), 0)
+        with open(output) as f:
+            self.assertEqual(f.read().count('\\cite{'), 3)
+
+    def test_args(self):
+        args = cli.parse_args(['x.bib', '-k', 'game', '-f', 'ID', '-f', 'year', '--rename', 'ID=ref'])
+        self.assertEqual(args.keyword_filter, 'game')
+        self.assertEqual(args.fields, ['ID', 'year'])
+        self.assertEqual(args.label_rename, {'ID': 'ref'})
+        args = cli.parse_args(['x.bib'])
+        self.assertEqual(args.fields, ['ID'])
+        self.assertEqual(args.label_rename, {'ID': 'reference'})
+
+    def test_watch_debounce(self):
+        path = os.path.join(self.tmp_dir, 'watched.bib')
+        with open(path, 'w') as f:
+            f.write('a')
+
+        def append(text):
+            with open(path, 'a') as f:
+                f.write(text)
+
+        # actions to run on each call to sleep:
+        # two writes in quick succession, then a quiet period, then one more write
+        actions = [None, lambda: append('b'), lambda: append('c'), None, None,
+                   None, lambda: append('d'), None]
+        sizes = []
+        def sleep(seconds):
+            action = actions.pop(0)
+            if action is not None:
+                action()
+
+        cli.watch(path, lambda: sizes.append(os.path.getsize(path)), max_events=2, sleep=sleep)
+        # the burst of writes only triggers once
+        self.assertEqual(sizes, [3, 4])
+        self.assertEqual(actions, [])
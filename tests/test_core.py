@@ -0,0 +1,170 @@
+import unittest
+import os
+import shutil
+import tempfile
+import bibtexparser
+import labels2tables.core as core
+
+SAMPLE_BIB = u"""% text before the first record is ignored
+@preamble{ "\\newcommand{\\noop}[1]{}" }
+@string{ plos = "PLoS ONE" }
+@comment{ a comment with an @ in it }
+
+@article{first_2010,
+	title = {Caf{\\'e} and {\\"u}ber},
+	journal = plos,
+	keywords = {game:soccer, model:network:centrality, open-access},
+	year = {2010}
+}
+  @article{second_2011,
+	title = {Multi
+	line title},
+	journal = {Other},
+	keywords = {game:soccer,
+	model:sequence},
+	year = 2011,
+}
+"""
+
+class TestBib2Labels(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        self.example_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bib_file = os.path.join(self.tmp_dir, 'sample.bib')
+        with open(self.bib_file, 'w') as f:
+            f.write(SAMPLE_BIB)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def full_parse(self, bib_file):
+        with open(bib_file) as f:
+            bibtex_str = f.read()
+        parser = core.create_parser()
+        return bibtexparser.loads(bibtex_str, parser=parser).entries
+    
+    def test_sport(self):
+        labels = core.bib2labels(os.path.join(self.example_dir, 'sport.in.bib'))
+        self.assertEqual(labels['cols'], ['game', 'model', 'open-access', 'reference'])
+        self.assertEqual(labels['data'][0], {
+            'game': ['soccer'],
+            'model': ['network', 'centrality'],
+            'open-access': True,
+            'reference': 'duch_quantifying_2010',
+        })
+        self.assertEqual(len(labels['data']), 3)
+    
+    def test_streaming_matches_full_parse(self):
+        streamed = list(core.iter_bib_entries(self.bib_file))
+        self.assertEqual(streamed, self.full_parse(self.bib_file))
+        self.assertEqual(streamed[0]['journal'], 'PLoS ONE')
+        self.assertEqual(streamed[0]['title'], u'Caf\u00e9 and \u00fcber')
+    
+    def test_selected_fields(self):
+        full = list(core.iter_bib_entries(self.bib_file))
+        selected = list(core.iter_bib_entries(self.bib_file, fields=["ID", "title"]))
+        self.assertEqual(selected, [
+            dict((k, e[k]) for k in ['keyword', 'ID', 'ENTRYTYPE', 'title'])
+            for e in full
+        ])
+    
+    def test_parallel_matches_serial(self):
+        # repeat the sample so that there are several chunks,
+        # with @string macros defined part way through
+        with open(self.bib_file, 'a') as f:
+            for i in range(20):
+                f.write(SAMPLE_BIB.replace('PLoS ONE', 'PLoS ONE %d' % i).replace('_201', '_%d_201' % i))
+        serial = list(core.iter_bib_entries(self.bib_file))
+        parallel = list(core.iter_bib_entries_parallel(self.bib_file, 2, chunk_size=500))
+        self.assertEqual(len(serial), 42)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(core.bib2labels(self.bib_file, workers=2), core.bib2labels(self.bib_file))
+    
+    def test_iter_bib_rows(self):
+        rows = list(core.iter_bib_rows(self.bib_file, keyword_filter="model", fields=["ID", "year"]))
+        self.assertEqual(rows, [
+            {'model': ['network', 'centrality'], 'reference': 'first_2010', 'year': '2010'},
+            {'model': ['sequence'], 'reference': 'second_2011', 'year': '2011'},
+        ])
+    
+    def test_filter_trie(self):
+        trie = core.FilterTrie(['game', '', 'model:net', 'game', 'mod'])
+        self.assertEqual(sorted(trie.matches('game:soccer')), [0, 1, 3])
+        self.assertEqual(sorted(trie.matches('model:network')), [1, 2, 4])
+        self.assertEqual(sorted(trie.matches('model:seq')), [1, 4])
+        self.assertEqual(trie.matches('open-access'), [1])
+    
+    def test_multi_matches_separate(self):
+        bib_file = os.path.join(self.example_dir, 'sport.in.bib')
+        configs = [
+            'game',
+            {'keyword_filter': 'model', 'fields': ['ID', 'year']},
+            {},
+            {'keyword_filter': 'model:network', 'keyword_separator': ':',
+             'label_rename': {'ID': 'ref', 'model': 'Model'}},
+            {'keyword_filter': 'nothing'},
+        ]
+        parsed = []
+        create_parser = core.create_parser
+        def counting_create_parser(*args, **kwargs):
+            parsed.append(args)
+            return create_parser(*args, **kwargs)
+        core.create_parser = counting_create_parser
+        try:
+            multi = core.bib2labels_multi(bib_file, configs)
+        finally:
+            core.create_parser = create_parser
+        self.assertEqual(len(parsed), 1)
+        
+        for config, labels in zip(configs, multi):
+            config = core.labels_config(config)
+            self.assertEqual(labels, core.bib2labels(bib_file, **config))
+    
+    def test_preview(self):
+        labels = core.bib2labels(os.path.join(self.example_dir, 'sport.in.bib'))
+        self.assertEqual(core.preview(labels, max_rows=2).splitlines()[3:5], [
+            'basketball sequence Y           yaari_hot_2011',
+            'soccer     network                            ',
+        ])
+
+    def test_labels2tsv(self):
+        labels = core.bib2labels(os.path.join(self.example_dir, 'sport.in.bib'))
+        output = os.path.join(self.tmp_dir, 'sport.csv')
+        core.labels2tsv(labels, output, flatten=True, dialect='excel')
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'game,model.1,model.2,open-access,reference')
+        self.assertEqual(lines[2], 'soccer,network,centrality,Y,duch_quantifying_2010')
+        
+        output = os.path.join(self.tmp_dir, 'sport.tsv')
+        core.labels2tsv(labels, output)
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[3], '\t centrality\tY\tduch_quantifying_2010')
+
+    def test_labels2latex(self):
+        labels = core.bib2labels(os.path.join(self.example_dir, 'sport.in.bib'))
+        output = os.path.join(self.tmp_dir, 'tables', 'sport.tex')
+        wrapper = os.path.join(self.tmp_dir, 'main.tex')
+        os.mkdir(os.path.dirname(output))
+        core.labels2latex(labels, output, wrapper, self.bib_file, chunk_rows=1, chunk_files=True)
+        with open(output) as f:
+            self.assertEqual(f.read(), '\\input{tables/sport-1}\n\\input{tables/sport-2}\n')
+        with open(os.path.join(self.tmp_dir, 'tables', 'sport-2.tex')) as f:
+            lines = f.read().splitlines()
+        self.assertIn(r' & \quad centrality & Y & \cite{duch_quantifying_2010} \\', lines)
+        self.assertEqual(lines[-1], r'\end{longtable}')
+        with open(wrapper) as f:
+            text = f.read()
+        self.assertIn('\\input{tables/sport}\n', text)
+        self.assertIn('\\bibliography{sample}\n', text)
+        
+        # cites follow a renamed ID col
+        labels = core.bib2labels(os.path.join(self.example_dir, 'sport.in.bib'), label_rename={'ID': 'key'})
+        core.labels2latex(labels, output, label_rename={'ID': 'key'})
+        with open(output) as f:
+            self.assertEqual(f.read().count('\\cite{'), 3)
+
+if __name__ == '__main__':
+    unittest.main()
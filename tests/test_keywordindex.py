@@ -0,0 +1,48 @@
+import unittest
+import os
+import labels2tables.core as core
+from labels2tables.keywordindex import KeywordIndex, bib2index
+
+class TestKeywordIndex(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        self.bib_file = os.path.normpath(os.path.join(d, '../examples/sport.in.bib'))
+        self.index = bib2index(self.bib_file)
+        # duch_quantifying_2010:  game:soccer, model:network:centrality, open-access
+        # yamamoto_common_2011:   game:soccer, model:network:scale-free, open-access
+        # yaari_hot_2011:         game:basketball, model:sequence, open-access
+
+    def test_match(self):
+        self.assertEqual(self.index.match('game:soccer'), frozenset([0, 1]))
+        self.assertEqual(self.index.match('model:network'), frozenset())
+        self.assertEqual(self.index.match('model:network:*'), frozenset([0, 1]))
+        self.assertEqual(self.index.match('model:*'), frozenset([0, 1, 2]))
+        self.assertEqual(self.index.match('model:net:*'), frozenset())
+        self.assertEqual(self.index.match('missing:*'), frozenset())
+        self.assertEqual(self.index.children('model'), ['network', 'sequence'])
+
+    def test_query(self):
+        index = self.index
+        self.assertEqual(index.query(), [0, 1, 2])
+        self.assertEqual(index.query(['open-access', 'model:network:*']), [0, 1])
+        self.assertEqual(index.query(['game:soccer'], ['model:network:scale-free']), [0])
+        self.assertEqual(index.query(exclude=['game:soccer']), [2])
+        self.assertEqual(index.query(['game:soccer', 'game:basketball']), [])
+
+    def test_labels(self):
+        labels = self.index.labels(['model:network:*'], keyword_filter='model')
+        expected = core.bib2labels(self.bib_file, keyword_filter='model')
+        expected['data'] = expected['data'][:2]
+        self.assertEqual(labels, expected)
+        # everything
+        self.assertEqual(self.index.labels(), core.bib2labels(self.bib_file))
+
+    def test_entries(self):
+        entries = [
+            {'ID': 'a', 'keyword': ['x:y:z', 'x:y', 'w']},
+            {'ID': 'b', 'keyword': ['x/y']},
+        ]
+        index = KeywordIndex(entries, keyword_separator='/')
+        self.assertEqual(index.match('x:y:z'), frozenset([0]))
+        self.assertEqual(index.match('x/*'), frozenset([1]))
+        self.assertEqual(index.match('*'), frozenset([0, 1]))
@@ -0,0 +1,177 @@
+import unittest
+import io
+import csv
+import os
+import labels2tables.tags2table as t2t
+import labels2tables.table as t
+import tests.sample_utils as utils
+
+class TestTxtTable(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        test_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.samples = []
+        for sub_file in sorted(os.listdir(test_dir)):
+            if sub_file.endswith('.spec.txt'):
+                self.samples.append(utils.load_sample(os.path.join(test_dir, sub_file)))
+    
+    def test_write_matches_present(self):
+        presenter = t.TxtTable()
+        for sample in self.samples:
+            table = t2t.tags2table(sample.arg)
+            out = io.StringIO()
+            presenter.write(table, out)
+            self.assertEqual(out.getvalue(), presenter.present(table), msg=sample.fname)
+            self.assertEqual(list(presenter.iter_lines(table)), presenter.present(table).split('\n'))
+
+    def test_stream_matches_cache(self):
+        presenter = t.TxtTable()
+        for sample in self.samples:
+            table = t2t.tags2table(sample.arg)
+            cache = presenter.display_cache(table)
+            self.assertEqual(list(presenter.iter_lines(table)), list(presenter.iter_lines(table, cache)), msg=sample.fname)
+
+    def test_display_cache(self):
+        presenter = t.TxtTable()
+        calls = []
+        def display(cell_data):
+            calls.append(cell_data)
+            return t.TxtTable._display(cell_data)
+        
+        for sample in self.samples:
+            table = t2t.tags2table(sample.arg)
+            del calls[:]
+            cache = t.DisplayCache(table, display)
+            # each distinct value is only converted once
+            self.assertEqual(len(calls), len(set(repr((type(x), x)) for x in calls)))
+            # and converting again is not needed to render
+            self.assertEqual(presenter.present(table, cache), presenter.present(table))
+            self.assertEqual(presenter.present(table, cache), presenter.present(table))
+
+    def test_tsv_matches_txt_cells(self):
+        for sample in self.samples:
+            for table in [t2t.tags2table(sample.arg), t2t.tags2table(sample.arg, t.SparseTable())]:
+                out = io.StringIO(newline='')
+                t.TsvTable().write(table, out)
+                rows = list(csv.reader(io.StringIO(out.getvalue(), newline=''), dialect='excel-tab'))
+                cache = t.TxtTable.display_cache(table)
+                self.assertEqual(rows, cache.head + list(cache.iter_rows()), msg=sample.fname)
+
+    def test_tsv_flat(self):
+        table_arg = {
+            'cols': ['game', 'model', 'open', 'reference'],
+            'data': [
+                {'game': ['soccer'], 'model': ['network', 'centrality'], 'open': True, 'reference': 'a'},
+                {'game': ['soccer'], 'model': ['network'], 'reference': 'b'},
+                {'model': [], 'open': True, 'reference': 'c'},
+            ],
+        }
+        headers, columns = t2t.tags2columns(table_arg)
+        out = io.StringIO(newline='')
+        t.TsvTable('excel').write_flat(headers, columns, out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'game,model.1,model.2,open,reference',
+            'soccer,network,centrality,Y,a',
+            # model is padded to model.- (as network has sub headers)
+            'soccer,network,,N,b',
+            '-,-,,Y,c',
+        ])
+
+    def test_latex_escape(self):
+        self.assertEqual(t.latex_escape('50% of R&D_2 {x}'), r'50\% of R\&D\_2 \{x\}')
+        self.assertEqual(t.latex_escape('a\\b~'), r'a\textbackslash{}b\textasciitilde{}')
+
+    def test_latex_head(self):
+        sample = [s for s in self.samples if s.fname.endswith('example_c.spec.txt')][0]
+        table = t2t.tags2table(sample.arg)
+        self.assertEqual(list(t.LatexTable().iter_head(table)), [
+            r'\begin{longtable}{lllll}',
+            r'\hline',
+            r' & \multicolumn{2}{l}{Fruit} & \multicolumn{2}{l}{Sweet} \\\cline{2-3}\cline{4-5}',
+            r'Rice & Apple & Banana & - & Cake \\',
+            r'\hline',
+            r'\endhead',
+            r'\hline',
+            r'\endfoot',
+        ])
+
+    def test_latex_chunks(self):
+        for sample in self.samples:
+            table = t2t.tags2table(sample.arg)
+            body = lambda lines: list(lines)[table.n_header_rows + 6:-1]
+            whole = body(list(t.LatexTable().iter_chunks(table))[0])
+            for chunk_rows in [1, 2, 3]:
+                chunks = [body(chunk) for chunk in t.LatexTable(chunk_rows).iter_chunks(table)]
+                self.assertEqual(sum(chunks, []), whole, msg=sample.fname)
+                for chunk in chunks:
+                    # each chunk starts a top level partition
+                    self.assertFalse(chunk[0].startswith(' & '), msg=sample.fname)
+                    self.assertFalse(chunk[0].startswith(r'\quad'), msg=sample.fname)
+
+    def test_latex_chunks_hierarchy(self):
+        # hierarchy in the first col: its header row starts each partition
+        table_arg = {
+            'cols': ['game', 'reference'],
+            'data': [
+                {'game': ['team', 'soccer'], 'reference': 'a'},
+                {'game': ['team', 'soccer'], 'reference': 'b'},
+                {'game': ['team', 'hockey'], 'reference': 'c'},
+                {'game': ['golf'], 'reference': 'd'},
+                {'game': ['team', 'hockey'], 'reference': 'e'},
+                {'game': ['board', 'chess', 'blitz'], 'reference': 'f'},
+                {'game': ['board', 'go'], 'reference': 'g'},
+            ],
+        }
+        table = t2t.tags2table(table_arg)
+        self.assertEqual(table.partition_rows, [4, 1, 2, 4])
+        body = lambda lines: list(lines)[table.n_header_rows + 6:-1]
+        whole = body(list(t.LatexTable().iter_chunks(table))[0])
+        tops = [r'team &  \\', r'golf & d \\', r'team &  \\', r'board &  \\']
+        for chunk_rows, n_chunks in [(1, 4), (2, 3), (5, 2), (11, 1)]:
+            chunks = [body(chunk) for chunk in t.LatexTable(chunk_rows).iter_chunks(table)]
+            self.assertEqual(sum(chunks, []), whole)
+            self.assertEqual(len(chunks), n_chunks)
+            for chunk in chunks:
+                self.assertIn(chunk[0], tops)
+
+    def test_latex_cite_non_str(self):
+        table_arg = {
+            'cols': ['id', 'game'],
+            'data': [
+                {'id': 12, 'game': 'golf'},
+                {'id': 7, 'game': 'soccer'},
+            ],
+        }
+        table = t2t.tags2table(table_arg)
+        lines = list(list(t.LatexTable(cite_cols=[0]).iter_chunks(table))[0])
+        body = lines[table.n_header_rows + 6:-1]
+        self.assertEqual(body, [r'\cite{12} & golf \\', r'\cite{7} & soccer \\'])
+
+    def test_sparse_table(self):
+        presenter = t.TxtTable()
+        for sample in self.samples:
+            dense = t2t.tags2table(sample.arg)
+            sparse = t2t.tags2table(sample.arg, t.SparseTable())
+            self.assertEqual(list(sparse.iter_rows()), list(dense.iter_rows()), msg=sample.fname)
+            self.assertEqual(list(sparse.iter_row_cells()), list(dense.iter_row_cells()), msg=sample.fname)
+            self.assertEqual(presenter.present(sparse), presenter.present(dense), msg=sample.fname)
+    
+    def test_sparse_set_row_cell(self):
+        table = t.SparseTable()
+        table.set_cols(4)
+        table.set_data_rows(2)
+        table.build()
+        table.set_row_cell(0, 2, 'b')
+        table.set_row_cell(0, 0, 'a', indent=1)
+        table.set_row_cell(0, 3, 'c')
+        table.set_row_cell(0, 2, 'B')
+        table.set_row_cell(1, 1, '')
+        self.assertEqual(list(table.iter_rows()), [['a', '', 'B', 'c'], ['', '', '', '']])
+        self.assertEqual(table.get_row_cell(0, 2), 'B')
+        self.assertEqual(table.get_row_indent(0, 0), 1)
+        self.assertEqual(table.get_row_indent(0, 2), 0)
+        table.set_row_cell(0, 2, '')
+        self.assertEqual(table.data[0], [0, 'a', 3, 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,10 @@ import unittest
 import labels2tables.tags2table as t2t
 import tests.sample_utils as utils
 import labels2tables.table as t
+import labels2tables.uniquebool as uniquebool
 import os
+import copy
+import random
 
 class TestTagsToTable(unittest.TestCase):
     def setUp(self):
@@ -38,5 +41,203 @@ class TestTagsToTable(unittest.TestCase):
             
             self.assertTrue(result, msg=sample.fname)
 
+    def test_data_not_modified(self):
+        for sub_file in sorted(os.listdir(self.test_dir)):
+            if not sub_file.endswith('.spec.txt'):
+                continue
+            
+            sample = utils.load_sample(os.path.join(self.test_dir, sub_file))
+            data = copy.deepcopy(sample.arg['data'])
+            t2t.tags2table(sample.arg)
+            self.assertEqual(sample.arg['data'], data, msg=sample.fname)
+            # no uniquebool objects leaked into the caller's data
+            self.assertEqual(repr(sample.arg['data']), repr(data), msg=sample.fname)
+
+    def test_preview_matches_full(self):
+        for sub_file in sorted(os.listdir(self.test_dir)):
+            if not sub_file.endswith('.spec.txt'):
+                continue
+            
+            sample = utils.load_sample(os.path.join(self.test_dir, sub_file))
+            for sort_rows in [False, True]:
+                arg = dict(sample.arg, sort_rows=sort_rows)
+                full = t.TxtTable.display_cache(t2t.tags2table(dict(arg)))
+                rows = list(full.iter_rows())
+                for max_rows in range(1, len(rows) + 2):
+                    table = t2t.tags2table(dict(arg), max_rows=max_rows)
+                    preview = t.TxtTable.display_cache(table)
+                    self.assertEqual(preview.head, full.head, msg=sample.fname)
+                    self.assertEqual(list(preview.iter_rows()), rows[:max_rows], msg=sample.fname)
+
+    def test_max_rows_at_least_one(self):
+        sample = utils.load_sample(os.path.join(self.test_dir, 'example_e.spec.txt'))
+        for sort_rows in [False, True]:
+            for max_rows in [0, -1]:
+                arg = dict(sample.arg, sort_rows=sort_rows)
+                self.assertRaises(ValueError, t2t.tags2table, arg, max_rows=max_rows)
+
+    def test_truncate_tree(self):
+        sample = utils.load_sample(os.path.join(self.test_dir, 'example_e.spec.txt'))
+        headers, columns = t2t.tags2columns(sample.arg)
+        for max_rows in range(1, 6):
+            tree = t2t.create_data_tree(columns)
+            t2t.truncate_tree(tree, max_rows)
+            self.assertEqual(tree.descendants, max_rows)
+
+    def test_tree_counts(self):
+        # counts kept up to date by add_child match a full recalculation
+        def counts(tree):
+            result = []
+            sweep = [tree]
+            while sweep:
+                node = sweep.pop()
+                result.append((node.name, node.descendants, node.depth))
+                sweep.extend(node.children)
+            return result
+        
+        sample = utils.load_sample(os.path.join(self.test_dir, 'example_a.spec.txt'))
+        header_tree, col_chains, _, _ = t2t.set_headers(sample.arg['cols'], sample.arg['data'], None)
+        columns = t2t.normalize_table(t2t.Columns(col_chains, sample.arg['data']), [None] * len(col_chains))
+        row_tree = t2t.create_data_tree(columns)
+        for tree in [header_tree, row_tree]:
+            expected = counts(tree)
+            tree.recalc_descendants()
+            self.assertEqual(counts(tree), expected)
+        self.assertEqual(row_tree.descendants, 15)
+    
+    def test_parallel_tree_matches_serial(self):
+        def nodes(tree):
+            result = []
+            sweep = [tree]
+            while sweep:
+                node = sweep.pop()
+                # (bools must still be the uniquebool objects, not copies)
+                is_bool = node.name is uniquebool.TRUE or node.name is uniquebool.FALSE
+                result.append((repr(node.name), is_bool, node.row_start, node.height, node.descendants, node.depth))
+                for child in node.children:
+                    self.assertIs(child.parent, node)
+                sweep.extend(node.children)
+            return result
+        
+        for sub_file in sorted(os.listdir(self.test_dir)):
+            if not sub_file.endswith('.spec.txt'):
+                continue
+            
+            sample = utils.load_sample(os.path.join(self.test_dir, sub_file))
+            headers, columns = t2t.tags2columns(sample.arg)
+            serial = t2t.create_data_tree(columns)
+            parallel = t2t.create_data_tree(columns, workers=2, min_rows=0)
+            self.assertEqual(nodes(parallel), nodes(serial), msg=sample.fname)
+            table = t2t.tags2table(sample.arg, workers=2)
+            self.assertTrue(t.TxtTable().cmp(t.TxtTable().present(table), sample.txt), msg=sample.fname)
+
+    def test_sort_rows(self):
+        sample = utils.load_sample(os.path.join(self.test_dir, 'example_d.spec.txt'))
+        arg = sample.arg
+        arg['data'] = list(reversed(arg['data']))
+        arg['sort_rows'] = True
+        presenter = t.TxtTable()
+        actual_txt = presenter.present(t2t.tags2table(arg))
+        self.assertTrue(presenter.cmp(actual_txt, sample.txt), msg=actual_txt)
+    
+    def test_sort_mixed_types(self):
+        arg = {
+            'cols': ['ref', 'colA', 'colB'],
+            'sort_rows': True,
+            'sort_last': ['ref'],
+            'data': [
+                {'ref': 'r1', 'colA': 'x', 'colB': True},
+                {'ref': 'r2', 'colA': 2},
+                {'ref': 'r3', 'colA': None},
+                {'ref': 'r4', 'colA': 'x', 'colB': False},
+                {'ref': 'r0', 'colA': 10},
+                {'ref': 'r5', 'colA': 'x', 'colB': True},
+            ]
+        }
+        table = t2t.tags2table(arg)
+        self.assertEqual([row[0] for row in table.iter_rows()], ['r3', 'r2', 'r0', 'r4', 'r1', 'r5'])
+    
+    def test_group_rows(self):
+        arg = {
+            'cols': ['game', 'open', 'ref'],
+            'group_rows': True,
+            'sort_last': ['ref'],
+            'data': [
+                {'ref': 'r1', 'game': ['soccer', 'indoor'], 'open': True},
+                {'ref': 'r2', 'game': ['golf']},
+                {'ref': 'r3', 'game': ['soccer', 'beach'], 'open': True},
+                {'ref': 'r4', 'game': ['soccer', 'indoor']},
+                {'ref': 'r5', 'game': ['golf'], 'open': True},
+                {'ref': 'r6', 'game': ['soccer', 'indoor'], 'open': True},
+            ]
+        }
+        table = t2t.tags2table(arg)
+        # first seen order, each value (and hierarchy level) only once
+        self.assertEqual([[row[0], row[1], row[2]] for row in table.iter_rows()], [
+            ['soccer', '', ''],
+            [['soccer', 'indoor'], uniquebool.TRUE, 'r1'],
+            ['', '', 'r6'],
+            ['', uniquebool.FALSE, 'r4'],
+            [['soccer', 'beach'], uniquebool.TRUE, 'r3'],
+            [['golf'], uniquebool.FALSE, 'r2'],
+            ['', uniquebool.TRUE, 'r5'],
+        ])
+    
+    def test_group_rows_last_col_hierarchy(self):
+        games = [['soccer', 'indoor'], ['golf'], ['soccer', 'beach'], 'golf', ['soccer', 'indoor']]
+        for cols in (['game'], ['open', 'game']):
+            arg = {
+                'cols': cols,
+                'group_rows': True,
+                'data': [{'open': True, 'game': game} for game in games],
+            }
+            table = t2t.tags2table(arg)
+            c = len(cols) - 1
+            # soccer header row only once, leaves stay in their own rows
+            self.assertEqual([row[c] for row in table.iter_rows()], [
+                'soccer', ['soccer', 'indoor'], ['soccer', 'beach'], ['soccer', 'indoor'], ['golf'], 'golf'])
+            self.assertEqual(table.n_data_rows, t2t.tags2table(dict(arg, sort_rows=True)).n_data_rows)
+    
+    def test_group_values_empty_hierarchy(self):
+        values = ['golf', ['soccer', 'indoor'], [], 'golf', ['soccer', 'beach'], []]
+        self.assertEqual(t2t.group_values(values, list(range(len(values)))), [[0, 3], [1], [4], [2, 5]])
+    
+    def test_group_rows_merges_like_sort(self):
+        rnd = random.Random(0)
+        for sub_file in sorted(os.listdir(self.test_dir)):
+            if not sub_file.endswith('.spec.txt'):
+                continue
+            
+            sample = utils.load_sample(os.path.join(self.test_dir, sub_file))
+            sorted_rows = t2t.tags2table(dict(sample.arg, sort_rows=True)).n_data_rows
+            for trial in range(5):
+                data = list(sample.arg['data'])
+                rnd.shuffle(data)
+                table = t2t.tags2table(dict(sample.arg, data=data, group_rows=True))
+                self.assertEqual(table.n_data_rows, sorted_rows, msg=sample.fname)
+            
+            # already grouped rows are left as they are
+            headers, columns = t2t.tags2columns(dict(sample.arg, sort_rows=True))
+            values = [list(col_values) for col_values in columns.values]
+            t2t.group_rows(columns)
+            self.assertEqual(columns.values, values, msg=sample.fname)
+
+    def test_normalize_column(self):
+        M = t2t.MISSING
+        T = uniquebool.TRUE
+        F = uniquebool.FALSE
+        # bool column, missing cells are False
+        values = [T, M, None, F]
+        self.assertEqual(t2t.normalize_column(values), 'bool')
+        self.assertEqual(values, [T, F, None, F])
+        # non-bool seen after some missing cells, missing cells are None
+        values = [M, T, M, 'x', M]
+        self.assertEqual(t2t.normalize_column(values), 'str')
+        self.assertEqual(values, [None, T, None, 'x', None])
+        # type given, hierarchies padded
+        values = [['A'], ['A', 'B'], M, []]
+        self.assertEqual(t2t.normalize_column(values, 'bool'), 'bool')
+        self.assertEqual(values, [['A', None], ['A', 'B'], F, []])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import io
+import os
+import labels2tables.core as core
+import labels2tables.tags2table as t2t
+import labels2tables.table as t
+import labels2tables.trace as trace
+import tests.sample_utils as utils
+
+class RecordingTracer(trace.Tracer):
+    def __init__(self):
+        self.events = []
+        self.counts = {}
+    def stage_start(self, stage):
+        self.events.append(('start', stage))
+    def stage_end(self, stage, elapsed, counts, peak):
+        self.events.append(('end', stage))
+        self.counts[stage] = counts
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        d = os.path.dirname(__file__)
+        self.test_dir = os.path.normpath(os.path.join(d, '../examples/'))
+        self.sample = utils.load_sample(os.path.join(self.test_dir, 'example_a.spec.txt'))
+
+    def test_stage_events(self):
+        tracer = RecordingTracer()
+        table = t2t.tags2table(self.sample.arg, tracer=tracer)
+        stages = ['set_headers', 'columns', 'normalize_table', 'create_data_tree',
+                  'build_table', 'fill_headers', 'fill_data_cels']
+        expected = []
+        for stage in stages:
+            expected += [('start', stage), ('end', stage)]
+        self.assertEqual(tracer.events, expected)
+        # same table as without a tracer
+        presenter = t.TxtTable()
+        self.assertEqual(presenter.present(table), presenter.present(t2t.tags2table(self.sample.arg)))
+
+    def test_counts(self):
+        tracer = RecordingTracer()
+        table = t2t.tags2table(self.sample.arg, tracer=tracer)
+        counts = tracer.counts['create_data_tree']
+        self.assertEqual(counts['rows'], table.n_data_rows)
+        # nodes are counted lazily, as a callable
+        self.assertTrue(counts['nodes'] >= table.n_data_rows)
+        # and never called when tracing is disabled
+        trace.end(trace.start(None, 'count'), nodes=lambda: self.fail())
+
+    def test_report(self):
+        report = trace.StageReport()
+        labels = core.bib2labels(os.path.join(self.test_dir, 'sport.in.bib'), tracer=report)
+        t2t.tags2table(labels, tracer=report)
+        t2t.tags2table(labels, tracer=report)
+        summary = report.summary()
+        self.assertEqual(summary[0][0], 'bib2labels')
+        self.assertEqual(summary[0][3], {'rows': 3, 'cols': 4})
+        calls = dict((entry[0], entry[1]) for entry in summary)
+        self.assertEqual(calls['bib2labels'], 1)
+        self.assertEqual(calls['sort_table'], 2)
+        out = io.StringIO()
+        report.print_report(out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), len(summary) + 1)
+        self.assertTrue(lines[-1].startswith('total'))
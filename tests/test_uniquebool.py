@@ -46,5 +46,17 @@ class TestUniquebool(unittest.TestCase):
         #print (result)
         self.assertEqual(result, expected)
 
+    def test_replace_copy_on_write(self):
+        unchanged = ['a', ('b', 1), {'c': [2]}]
+        self.assertIs(uniquebool.replace_bool(unchanged), unchanged)
+        
+        case = ['a', ['b', True], ('c',), {'d': False}]
+        case_copy = copy.deepcopy(case)
+        result = uniquebool.replace_bool(case)
+        self.assertEqual(result, ['a', ['b', uniquebool.TRUE], ('c',), {'d': uniquebool.FALSE}])
+        # original is untouched, and unchanged parts are shared rather than copied
+        self.assertEqual(case, case_copy)
+        self.assertIs(result[2], case[2])
+
 if __name__ == '__main__':
     unittest.main()